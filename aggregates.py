@@ -0,0 +1,152 @@
+#!/usr/bin/python
+#
+# aggregates - streaming statistics over the metrics of every host in a
+# cluster, reported to Nagios as cluster level services
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import math
+
+# relative error of the quantiles estimated by Histogram
+RELATIVE_ACCURACY = 0.01
+
+
+# Histogram with logarithmic buckets: a value v > 0 is counted in bucket
+# ceil(log(v) / log(gamma)), so every value in a bucket is within
+# relative_accuracy of the value reported for the bucket.  The number of
+# buckets depends on the range of the values, not on how many there are.
+class Histogram:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value > 0:
+            i = int(math.ceil(math.log(value) / self.log_gamma))
+            self.positive[i] = self.positive.get(i, 0) + 1
+        elif value < 0:
+            i = int(math.ceil(math.log(-value) / self.log_gamma))
+            self.negative[i] = self.negative.get(i, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def bucket_value(self, i):
+        return 2 * self.gamma ** i / (self.gamma + 1)
+
+    # returns the estimated q quantile (0 <= q <= 1), None if empty
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        value = self.max
+        for i in sorted(self.negative, reverse=True):
+            seen += self.negative[i]
+            if seen > rank:
+                value = -self.bucket_value(i)
+                break
+        else:
+            seen += self.zero
+            if seen > rank:
+                value = 0.0
+            else:
+                for i in sorted(self.positive):
+                    seen += self.positive[i]
+                    if seen > rank:
+                        value = self.bucket_value(i)
+                        break
+        return min(max(value, self.min), self.max)
+
+
+# Collects the values of one aggregate service for a cluster, aggregate
+# is the conf_parser.AggregateRule
+class Accumulator:
+    def __init__(self, aggregate, service_name):
+        self.aggregate = aggregate
+        self.service_name = service_name
+        self.count = 0
+        self.total = 0.0
+        self.above = 0
+        self.min = None
+        self.max = None
+        self.units = ''
+        self.histogram = None
+        if aggregate.quantile is not None:
+            self.histogram = Histogram()
+
+    def add(self, value, units):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.aggregate.count_above is not None and value > self.aggregate.count_above:
+            self.above += 1
+        if self.histogram is not None:
+            self.histogram.add(value)
+        self.units = units
+
+    # returns the value of the statistic, None if no host reported one
+    def value(self):
+        statistic = self.aggregate.statistic
+        if statistic == 'count':
+            return float(self.count)
+        if statistic == 'count_above':
+            return float(self.above)
+        if self.count == 0:
+            return None
+        if statistic == 'max':
+            return self.max
+        if statistic == 'min':
+            return self.min
+        if statistic == 'mean':
+            return self.total / self.count
+        return self.histogram.quantile(self.aggregate.quantile)
+
+    # the plugin output, with the value as performance data
+    def output(self, state, value):
+        if value is None:
+            return '%s %s - no values reported' % (self.service_name, state)
+        aggregate = self.aggregate
+        units = self.units
+        if aggregate.statistic in ('count', 'count_above'):
+            units = ''
+        if aggregate.statistic == 'count_above':
+            description = 'count above %g' % aggregate.count_above
+        else:
+            description = aggregate.statistic
+        warn = aggregate.warn_above if aggregate.warn_above is not None else aggregate.warn_below
+        crit = aggregate.crit_above if aggregate.crit_above is not None else aggregate.crit_below
+        return '%s %s - %s %g%s over %d hosts|%s=%g;%s;%s;; count=%d;;;0;' % (
+            self.service_name, state, description, value, units, self.count,
+            aggregate.statistic, value, '' if warn is None else '%g' % warn,
+            '' if crit is None else '%g' % crit, self.count)
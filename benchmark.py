@@ -0,0 +1,364 @@
+#!/usr/bin/python
+#
+# benchmark - measures the throughput of ganglia-nagios-bridge on a
+# synthetic grid served by a local fake gmetad, with a stub Nagios
+# inventory in place of pynag
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+############################################################################
+
+import argparse
+from cStringIO import StringIO
+import imp
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import tempfile
+import time
+import xml.sax
+import conf_parser
+import fake_gmetad
+import match_index
+import nagios_checkresult
+import nagios_inventory
+import subtree_filter
+import xml_engines
+import xml_spool
+
+bridge = imp.load_source('ganglia_nagios_bridge', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ganglia-nagios-bridge.py'))
+
+# the phases reported, in the order they happen in a poll
+PHASES = ['connect', 'receive', 'inventory', 'parse', 'evaluate', 'write', 'submit']
+
+GRID_START = """<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>
+<GANGLIA_XML VERSION="3.6.0" SOURCE="gmetad">
+<GRID NAME="synthetic" AUTHORITY="http://localhost/ganglia/" LOCALTIME="%d">
+"""
+GRID_END = "</GRID>\n</GANGLIA_XML>\n"
+CLUSTER_START = '<CLUSTER NAME="%s" LOCALTIME="%d" OWNER="unspecified" LATLONG="unspecified" URL="unspecified">\n'
+CLUSTER_END = "</CLUSTER>\n"
+HOST_START = '<HOST NAME="%s" IP="10.%d.%d.%d" REPORTED="%d" TN="%d" TMAX="20" DMAX="0" LOCATION="unspecified" GMOND_STARTED="%d" TAGS="">\n'
+HOST_END = "</HOST>\n"
+METRIC = ('<METRIC NAME="%s" VAL="%s" TYPE="%s" UNITS="%s" TN="%d" TMAX="60" DMAX="0" SLOPE="both" SOURCE="gmond">\n'
+          '<EXTRA_DATA>\n'
+          '<EXTRA_ELEMENT NAME="GROUP" VAL="%s"/>\n'
+          '<EXTRA_ELEMENT NAME="DESC" VAL="Synthetic metric %s"/>\n'
+          '<EXTRA_ELEMENT NAME="TITLE" VAL="%s"/>\n'
+          '</EXTRA_DATA>\n'
+          '</METRIC>\n')
+
+
+def cluster_name(c):
+    return 'cluster%03d' % c
+
+
+def host_name(c, h):
+    return 'c%03d-h%05d.example.com' % (c, h)
+
+
+def metric_name(m):
+    return 'metric_%03d' % m
+
+
+def service_name(m):
+    return 'Synthetic metric %d' % m
+
+
+# Returns the XML of cluster c with hosts x metrics.  Every fourth
+# metric is a string, the others are floats between 0 and 100 so that
+# the thresholds used by synthetic_config() give a mix of states.
+def generate_cluster(c, hosts, metrics, localtime):
+    out = [CLUSTER_START % (cluster_name(c), localtime)]
+    for h in range(hosts):
+        out.append(HOST_START % (host_name(c, h), c % 256, h // 256 % 256, h % 256, localtime - 5, 5, localtime - 86400))
+        for m in range(metrics):
+            if m % 4 == 3:
+                value, metric_type, units = 'version %d' % (h % 3), 'string', ''
+            else:
+                value, metric_type, units = '%.2f' % ((c * 7 + h * 13 + m * 17) % 10000 / 100.0), 'float', '%'
+            out.append(METRIC % (metric_name(m), value, metric_type, units, (h + m) % 30, metric_type, m, metric_name(m)))
+        out.append(HOST_END)
+    out.append(CLUSTER_END)
+    return ''.join(out)
+
+
+# Returns the XML of a grid with clusters x hosts x metrics
+def generate_grid(clusters, hosts, metrics, localtime=1400000000):
+    out = [GRID_START % localtime]
+    for c in range(clusters):
+        out.append(generate_cluster(c, hosts, metrics, localtime))
+    out.append(GRID_END)
+    return ''.join(out)
+
+
+# writes the grid to path one cluster at a time, so grids larger than
+# the memory of the benchmark can be generated
+def write_grid(path, clusters, hosts, metrics, localtime=1400000000):
+    with open(path, 'wb') as f:
+        f.write(GRID_START % localtime)
+        for c in range(clusters):
+            f.write(generate_cluster(c, hosts, metrics, localtime))
+        f.write(GRID_END)
+
+
+# Returns the ConfigParser.clusters for the first monitored_clusters
+# clusters, monitoring the first monitored_metrics metrics of every host
+def synthetic_config(monitored_clusters, hosts, monitored_metrics):
+    metrics = []
+    for m in range(monitored_metrics):
+        if m % 2 == 0:
+            metric_def = conf_parser.ThresholdRule(service_name(m), crit_above='90', warn_above='80')
+        else:
+            metric_def = conf_parser.ThresholdRule(service_name(m), crit_below='5', warn_below='10')
+        metrics.append((metric_name(m), metric_def))
+    clusters = []
+    for c in range(monitored_clusters):
+        cluster_hosts = {}
+        for h in range(hosts):
+            cluster_hosts[host_name(c, h).partition('.')[0]] = [metrics]
+        clusters.append((cluster_name(c), cluster_hosts))
+    return clusters
+
+
+# stub for pynag: every host in the grid with every monitored service
+def synthetic_inventory(clusters, hosts, monitored_metrics):
+    services = [service_name(m) for m in range(monitored_metrics)]
+    inventory = nagios_inventory.NagiosInventory()
+    for c in range(clusters):
+        for h in range(hosts):
+            inventory.add(host_name(c, h).partition('.')[0], services)
+    return inventory
+
+
+# measures the time spent in the checkresult writer
+class TimedWriter:
+    def __init__(self, writer):
+        self.writer = writer
+        self.elapsed = 0.0
+        self.records = 0
+
+    def build_host(self, *args):
+        start = time.time()
+        self.writer.build_host(*args)
+        self.elapsed += time.time() - start
+        self.records += 1
+
+    def build_service(self, *args):
+        start = time.time()
+        self.writer.build_service(*args)
+        self.elapsed += time.time() - start
+        self.records += 1
+
+
+# parses xml_data, without the unmonitored subtrees if index is given
+def parse(xml_data, handler, index=None, engine='sax'):
+    source = StringIO(xml_data)
+    if index is not None:
+        source = subtree_filter.SubtreeFilter(source, index, True)
+    xml_engines.ENGINES[engine](source, handler)
+
+
+# Runs one poll against the fake gmetad and returns the timings.
+# parse, evaluate and write happen together while the XML is parsed, so
+# the XML is parsed once with an empty handler to measure parsing alone,
+# then with GangliaHandler; the time spent in the writer is measured
+# directly and the rest is the cost of evaluating the elements.
+def run(args):
+    xml_data = generate_grid(args.clusters, args.hosts, args.metrics)
+    elements = xml_data.count('<') - xml_data.count('</') - 1
+    gmetad = fake_gmetad.FakeGmetad(lambda path: xml_data)
+    gmetad.start()
+    result_dir = tempfile.mkdtemp(prefix='bridge-benchmark')
+    timings = {}
+    try:
+        start = time.time()
+        sock = socket.create_connection(('127.0.0.1', gmetad.port))
+        timings['connect'] = time.time() - start
+
+        start = time.time()
+        received = xml_spool.XMLSpool(len(xml_data) + 1).drain(sock).read()
+        timings['receive'] = time.time() - start
+
+        start = time.time()
+        inventory = synthetic_inventory(args.clusters, args.hosts, args.monitored_metrics)
+        index = match_index.MatchIndex(synthetic_config(args.monitored_clusters, args.hosts, args.monitored_metrics), inventory)
+        timings['inventory'] = time.time() - start
+
+        pg = bridge.PassiveGenerator(0, 60)
+        skip_index = None
+        if args.skip_unmonitored:
+            skip_index = index
+        start = time.time()
+        parse(received, xml.sax.ContentHandler(), skip_index, args.engine)
+        parse_time = time.time() - start
+
+        gn = nagios_checkresult.GenerateNagiosCheckResult()
+        gn.create(result_dir, int(time.time()))
+        writer = TimedWriter(gn)
+        start = time.time()
+        parse(received, bridge.GangliaHandler(index, pg, writer, True), skip_index, args.engine)
+        handler_time = time.time() - start
+
+        start = time.time()
+        gn.submit()
+        timings['submit'] = time.time() - start
+    finally:
+        gmetad.stop()
+        shutil.rmtree(result_dir)
+
+    timings['parse'] = parse_time
+    timings['evaluate'] = max(handler_time - parse_time - writer.elapsed, 0.0)
+    timings['write'] = writer.elapsed
+    total = sum(timings.values())
+    return {'grid': {'clusters': args.clusters, 'hosts': args.hosts, 'metrics': args.metrics,
+                     'monitored_clusters': args.monitored_clusters, 'monitored_metrics': args.monitored_metrics,
+                     'skip_unmonitored': args.skip_unmonitored, 'engine': args.engine},
+            'bytes': len(xml_data),
+            'elements': elements,
+            'results': writer.records,
+            'phases': timings,
+            'total': total,
+            'elements_per_second': elements / handler_time,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+# the resident set size of this process in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Runs in a fresh process: builds the inventory and index for the grid
+# in grid_file and streams it through GangliaHandler, returning the
+# memory held by the model and the peak while parsing
+def measure_memory(args, grid_file, result_dir):
+    rss_start = current_rss()
+    inventory = synthetic_inventory(args.clusters, args.hosts, args.monitored_metrics)
+    index = match_index.MatchIndex(synthetic_config(args.monitored_clusters, args.hosts, args.monitored_metrics), inventory)
+    rss_model = current_rss()
+    gn = nagios_checkresult.GenerateNagiosCheckResult()
+    rss_polls = []
+    # the grid is parsed twice, the second time as the next poll of a
+    # daemon
+    for poll in range(2):
+        gn.create(result_dir, int(time.time()))
+        handler = bridge.GangliaHandler(index, bridge.PassiveGenerator(0, 60), gn, True)
+        source = open(grid_file, 'rb')
+        if args.skip_unmonitored:
+            source = subtree_filter.SubtreeFilter(source, index, True)
+        xml_engines.ENGINES[args.engine](source, handler)
+        gn.submit()
+        rss_polls.append(current_rss())
+    return {'hosts': args.clusters * args.hosts,
+            'model': rss_model - rss_start,
+            'first_poll': rss_polls[0] - rss_model,
+            'second_poll': rss_polls[1] - rss_polls[0],
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+# Measures the memory of the bridge as the hosts per cluster double
+# steps times, each size in its own process.  The XML is written to a
+# file and streamed, so only the memory of the bridge itself grows.
+def run_memory(args, steps):
+    tmp_dir = tempfile.mkdtemp(prefix='bridge-benchmark')
+    hosts = args.hosts
+    results = []
+    try:
+        grid_file = os.path.join(tmp_dir, 'grid.xml')
+        for step in range(steps):
+            step_args = argparse.Namespace(**vars(args))
+            step_args.hosts = hosts << step
+            write_grid(grid_file, step_args.clusters, step_args.hosts, step_args.metrics)
+            pool = multiprocessing.Pool(1)
+            try:
+                results.append(pool.apply(measure_memory, (step_args, grid_file, tmp_dir)))
+            finally:
+                pool.terminate()
+            for name in os.listdir(tmp_dir):
+                os.unlink(os.path.join(tmp_dir, name))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+
+def report_memory(results):
+    print '%10s %12s %12s %12s %12s %12s' % ('hosts', 'model MiB', 'bytes/host', 'poll 1 MiB', 'poll 2 MiB', 'peak MiB')
+    for r in results:
+        print '%10d %12.1f %12d %12.1f %12.1f %12.1f' % (
+            r['hosts'], r['model'] / 1048576.0, r['model'] / r['hosts'], r['first_poll'] / 1048576.0,
+            r['second_poll'] / 1048576.0, r['peak_rss'] / 1048576.0)
+
+
+def report(results, baseline=None):
+    def delta(new, old):
+        if not old:
+            return ''
+        return '%+7.1f%%' % ((new - old) * 100.0 / old)
+    grid = results['grid']
+    print 'grid: %(clusters)d clusters x %(hosts)d hosts x %(metrics)d metrics' % grid,
+    print '(%(monitored_clusters)d clusters, %(monitored_metrics)d metrics monitored)' % grid
+    print '%d bytes, %d elements, %d check results' % (results['bytes'], results['elements'], results['results'])
+    for phase in PHASES:
+        seconds = results['phases'][phase]
+        old = baseline and baseline['phases'].get(phase)
+        print '%-10s %10.4f s %s' % (phase, seconds, delta(seconds, old))
+    print '%-10s %10.4f s %s' % ('total', results['total'], delta(results['total'], baseline and baseline['total']))
+    print '%-10s %10.0f /s %s' % ('elements', results['elements_per_second'],
+                                 delta(results['elements_per_second'], baseline and baseline['elements_per_second']))
+    print '%-10s %10.1f MiB %s' % ('peak rss', results['peak_rss'] / 1048576.0,
+                                  delta(results['peak_rss'], baseline and baseline['peak_rss']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measure ganglia-nagios-bridge on a synthetic grid')
+    parser.add_argument('--clusters', type=int, default=10)
+    parser.add_argument('--hosts', type=int, default=100, help='hosts per cluster')
+    parser.add_argument('--metrics', type=int, default=40, help='metrics per host')
+    parser.add_argument('--monitored-clusters', type=int, default=None, help='default: all clusters')
+    parser.add_argument('--monitored-metrics', type=int, default=10)
+    parser.add_argument('--no-skip', dest='skip_unmonitored', action='store_false',
+                        help='parse the unmonitored clusters and hosts too')
+    parser.add_argument('--engine', choices=sorted(xml_engines.ENGINES.keys()), default='sax',
+                        help='the XML parser, as xml_engine in the configuration')
+    parser.add_argument('--memory', type=int, metavar='STEPS',
+                        help='measure the memory used as the hosts per cluster double STEPS times')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    parser.add_argument('--save', help='save the results as JSON')
+    args = parser.parse_args()
+    if args.monitored_clusters is None:
+        args.monitored_clusters = args.clusters
+
+    if args.memory:
+        results = run_memory(args, args.memory)
+        report_memory(results)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        raise SystemExit(0)
+
+    results = run(args)
+    baseline = None
+    if args.baseline:
+        baseline = json.load(open(args.baseline))
+    report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
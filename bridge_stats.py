@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# bridge_stats - counters and phase timers describing one poll, written
+# to a JSON file and reported to Nagios as a passive check of the bridge
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+COUNTERS = ('elements', 'subtrees_skipped', 'metrics_matched', 'metrics_unknown_to_nagios', 'results_written', 'results_coalesced', 'bytes_received')
+# measured once per poll: checkresult files waiting for Nagios and the
+# age of the oldest in seconds
+GAUGES = ('checkresult_backlog', 'checkresult_backlog_age')
+PHASES = ('connect', 'inventory', 'parse', 'evaluate', 'write')
+
+
+# wraps an XML document to count the bytes read by the parser
+class CountingReader:
+    def __init__(self, source, stats):
+        self.source = source
+        self.stats = stats
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.stats.counters['bytes_received'] += len(data)
+        return data
+
+    def close(self):
+        self.source.close()
+
+
+class BridgeStats:
+    def __init__(self):
+        self.started = time.time()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.gauges = dict.fromkeys(GAUGES, 0)
+        self.sources = {}
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    # adds the counters and phases collected by another BridgeStats
+    def merge(self, counters, phases):
+        for name, n in counters.items():
+            self.counters[name] += n
+        for phase, seconds in phases.items():
+            self.phases[phase] += seconds
+
+    # times the enclosed block, adding it to phase
+    @contextmanager
+    def phase(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[phase] += time.time() - start
+
+    # seconds since the poll started
+    def elapsed(self):
+        return time.time() - self.started
+
+    def to_dict(self):
+        return {'started': self.started,
+                'duration': self.elapsed(),
+                'counters': self.counters,
+                'phases': self.phases,
+                'gauges': self.gauges,
+                'sources': self.sources}
+
+    # writes the stats atomically so readers never see a partial file
+    def write_json(self, path):
+        stats_dir = os.path.dirname(os.path.abspath(path))
+        fd, tmp_name = tempfile.mkstemp(prefix='.stats', dir=stats_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            os.chmod(tmp_name, 0644)
+            os.rename(tmp_name, path)
+        except:
+            os.unlink(tmp_name)
+            raise
+
+    # Nagios performance data for the poll so far
+    def perfdata(self, warn, crit):
+        items = ['duration=%.3fs;%s;%s;0;' % (self.elapsed(), warn, crit)]
+        for phase in PHASES:
+            items.append('%s=%.3fs;;;0;' % (phase, self.phases[phase]))
+        # the counters start again at 0 every poll, the 'c' unit would
+        # tell graphing tools they only ever increase
+        for counter in COUNTERS:
+            unit = 'B' if counter == 'bytes_received' else ''
+            items.append('%s=%d%s;;;0;' % (counter, self.counters[counter], unit))
+        items.append('checkresult_backlog=%d;;;0;' % self.gauges['checkresult_backlog'])
+        items.append('checkresult_backlog_age=%ds;;;0;' % self.gauges['checkresult_backlog_age'])
+        return ' '.join(items)
+
+    # Writes a passive service check for the bridge itself, WARNING or
+    # CRITICAL if the poll took more than warn or crit seconds
+    def emit_check(self, checkresult_file_handler, host_name, service_name, warn, crit):
+        duration = self.elapsed()
+        if duration > crit:
+            return_code = 2
+        elif duration > warn:
+            return_code = 1
+        else:
+            return_code = 0
+        now = '%.1f' % time.time()
+        output = '%s %s - poll took %.3f seconds, %d results written|%s' % (
+            service_name, checkresult_file_handler.service_state[return_code], duration,
+            self.counters['results_written'], self.perfdata(warn, crit))
+        checkresult_file_handler.build_service(time.asctime(), host_name, service_name, 0, 0, 1, 1, 0.1, now, now, 0, 1, return_code, None, None, output)
+        return return_code
@@ -1,50 +1,225 @@
 #! /usr/bin/python
 
+import ast
+import hashlib
+import os
+import re
+import tokenize
 from configobj import ConfigObj,ConfigObjError
+import ganglia_sources
+import match_index
+import xml_engines
+
+# start of the clusters = [...] list used by nagios-bridge.conf
+CLUSTERS_LITERAL = re.compile(r'clusters\s*=\s*\[')
+# a quantile statistic, p95 or p99.9
+QUANTILE_STATISTIC = re.compile(r'p(\d+(?:\.\d+)?)\Z')
+
+
+# the service name and thresholds of a metric, the thresholds are
+# converted to numbers once when the configuration is read
+class ThresholdRule(object):
+    __slots__ = ('service_name', 'crit_above', 'crit_below', 'warn_above', 'warn_below')
+
+    def __init__(self, service_name, crit_above=None, crit_below=None, warn_above=None, warn_below=None):
+        self.service_name = service_name
+        self.crit_above = threshold(crit_above)
+        self.crit_below = threshold(crit_below)
+        self.warn_above = threshold(warn_above)
+        self.warn_below = threshold(warn_below)
+
+
+# A cluster level service computed from one metric of every host in a
+# cluster.  The thresholds apply to the value of the statistic: max,
+# min, mean, count, count_above (the hosts whose value is above
+# count_above) or a quantile such as p95.
+class AggregateRule(ThresholdRule):
+    __slots__ = ('host_name', 'statistic', 'quantile', 'count_above')
+
+    def __init__(self, service_name, host_name, statistic, count_above=None, crit_above=None, crit_below=None, warn_above=None, warn_below=None):
+        ThresholdRule.__init__(self, service_name, crit_above, crit_below, warn_above, warn_below)
+        # the Nagios host of the service, None for the cluster name
+        self.host_name = host_name
+        self.statistic = statistic
+        self.quantile = None
+        self.count_above = threshold(count_above)
+        quantile = QUANTILE_STATISTIC.match(statistic)
+        if quantile is not None:
+            self.quantile = float(quantile.group(1)) / 100
+        elif statistic not in ('max', 'min', 'mean', 'count', 'count_above'):
+            raise ValueError('Unknown statistic %s for %s' % (statistic, service_name))
+        if statistic == 'count_above' and self.count_above is None:
+            raise ValueError('count_above is required for %s' % service_name)
+
+
+def threshold(value):
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+# Returns the lines of the configuration without the clusters = [...]
+# list, and the list itself evaluated as a Python literal (None if there
+# is none).  Comments inside the list are dropped by the tokenizer.
+def split_clusters_literal(lines):
+    for start, line in enumerate(lines):
+        if CLUSTERS_LITERAL.match(line):
+            break
+    else:
+        return lines, None
+    literal = []
+    depth = 0
+    for tok_type, tok_string, tok_start, tok_end, tok_line in tokenize.generate_tokens(iter(lines[start:]).next):
+        if tok_string in ('(', '[', '{'):
+            depth += 1
+        elif tok_string in (')', ']', '}'):
+            depth -= 1
+        if depth == 0 and not literal:
+            continue
+        if tok_type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE):
+            literal.append(tok_string)
+        if depth == 0:
+            end = start + tok_end[0]
+            break
+    else:
+        raise ValueError('unterminated clusters list')
+    return lines[:start] + lines[end:], ast.literal_eval(' '.join(literal))
+
+
+# the mtime, size and SHA-1 of the configuration file, read together
+# with its lines so the key always describes what was parsed
+def read_source(config_file):
+    with open(config_file, 'rb') as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    return (st.st_mtime, st.st_size, hashlib.sha1(data).hexdigest()), data.splitlines(True)
 
 
 class ConfigParser:
     def __init__(self):
         self.clusters =[]
+        #(mtime, size, sha1) of the file parsed, used by config_cache
+        self.source = None
+        #definitions with the same service and thresholds share one rule
+        self.rules = {}
 
     def parse (self,config_file):
         try:
-            config = ConfigObj(config_file)
+            self.source, lines = read_source(config_file)
+            lines, clusters_literal = split_clusters_literal(lines)
+            config = ConfigObj(lines)
 
             #get gmetad host information and nagios checkresult directory
-            self.gmetad_host = config.pop('gmetad_host')
-            self.gmetad_port = config.pop('gmetad_port')
-            self.force_dmax = config.pop('force_dmax')
-            self.tmax_grace = config.pop('tmax_grace')
+            #one or more gmetad/gmond servers, each given as host:port
+            if 'gmetad_sources' in config:
+                self.gmetad_sources = ganglia_sources.parse_source_list(config.as_list('gmetad_sources'), 8651)
+                del config['gmetad_sources']
+            else:
+                self.gmetad_sources = [(config.pop('gmetad_host'), int(config.pop('gmetad_port')))]
+            #seconds to wait for a source to accept the connection or send data
+            self.gmetad_timeout = float(config.pop('gmetad_timeout', 60))
+            self.force_dmax = int(config.pop('force_dmax', 0))
+            self.tmax_grace = int(config.pop('tmax_grace', 60))
             self.strip_domains = config.pop('strip_domains')
             self.nagios_result_dir = config.pop('nagios_result_dir')
+            #maximum number of check results per checkresult file, 0 for no limit
+            self.checkresult_max_records = int(config.pop('checkresult_max_records', 0))
+            #coalesce results and poll less often while Nagios has more than
+            #checkresult_max_backlog files or files older than checkresult_max_age
+            #seconds to read, 0 disables either limit
+            self.checkresult_max_backlog = int(config.pop('checkresult_max_backlog', 0))
+            self.checkresult_max_age = int(config.pop('checkresult_max_age', 0))
+            self.checkresult_max_backoff = int(config.pop('checkresult_max_backoff', 4))
+            self.checkresult_ledger = config.pop('checkresult_ledger', '/var/lib/ganglia-nagios-bridge/checkresults')
+            #only write results that changed, refreshing every state_refresh minutes
+            self.suppress_unchanged = False
+            if 'suppress_unchanged' in config:
+                self.suppress_unchanged = config.as_bool('suppress_unchanged')
+                del config['suppress_unchanged']
+            self.state_file = config.pop('state_file', '/var/lib/ganglia-nagios-bridge/state')
+            self.state_refresh = int(config.pop('state_refresh', 10))
+            #drop unmonitored clusters and hosts before the XML is parsed
+            self.skip_unmonitored = True
+            if 'skip_unmonitored' in config:
+                self.skip_unmonitored = config.as_bool('skip_unmonitored')
+                del config['skip_unmonitored']
+            #read all the XML before parsing it, spilling to disk above spool_max_memory MiB
+            self.spool_xml = False
+            if 'spool_xml' in config:
+                self.spool_xml = config.as_bool('spool_xml')
+                del config['spool_xml']
+            self.spool_max_memory = int(config.pop('spool_max_memory', 256)) * 1024 * 1024
+            #request only the configured clusters from the gmetad interactive port
+            self.gmetad_query = False
+            if 'gmetad_query' in config:
+                self.gmetad_query = config.as_bool('gmetad_query')
+                del config['gmetad_query']
+            self.gmetad_query_port = int(config.pop('gmetad_query_port', 8652))
+            self.gmetad_query_parallel = int(config.pop('gmetad_query_parallel', 4))
+            self.gmetad_query_max_hosts = int(config.pop('gmetad_query_max_hosts', 20))
+            #the XML parser, see xml_engines
+            self.xml_engine = config.pop('xml_engine', 'sax')
+            if self.xml_engine not in xml_engines.ENGINES:
+                raise ValueError('Unknown xml_engine %s' % self.xml_engine)
+            #processes parsing the XML, split at CLUSTER boundaries
+            self.parse_processes = int(config.pop('parse_processes', 1))
+            #seconds between polls when running as a daemon
+            self.poll_interval = int(config.pop('poll_interval', 60))
+            #statistics about each poll, as JSON and as a passive check of the bridge
+            self.stats_file = config.pop('stats_file', None)
+            self.stats_host = config.pop('stats_host', None)
+            self.stats_service = config.pop('stats_service', 'Ganglia Nagios Bridge')
+            self.stats_warn = float(config.pop('stats_warn', self.poll_interval * 0.8))
+            self.stats_crit = float(config.pop('stats_crit', self.poll_interval))
+            #optional cache of the hosts and services known to Nagios
+            self.nagios_inventory_cache = config.pop('nagios_inventory_cache', None)
 
 
-            for cluster_name in config.keys():
+            #cluster level services, as (cluster_name, metric_name, AggregateRule)
+            self.aggregates = []
+            if 'aggregates' in config:
+                for service_name, aggregate_conf in config.pop('aggregates').items():
+                    aggregate = AggregateRule(aggregate_conf.get('service_name', service_name), aggregate_conf.get('host'),
+                                              aggregate_conf['statistic'], aggregate_conf.get('count_above'),
+                                              aggregate_conf.get('crit_above'), aggregate_conf.get('crit_below'),
+                                              aggregate_conf.get('warn_above'), aggregate_conf.get('warn_below'))
+                    self.aggregates.append((aggregate_conf['cluster'], aggregate_conf['metric'], aggregate))
+
+            #clusters given as a list of (regex, [(regex, [(regex, attributes)])])
+            if clusters_literal is not None:
+                for cluster_name, hosts in clusters_literal:
+                    cluster_hosts = {}
+                    for host_name, metric_confs in hosts:
+                        metrics = [(metric_name, self.rule(metric_conf)) for metric_name, metric_conf in metric_confs]
+                        cluster_hosts.setdefault(host_name, []).append(metrics)
+                    self.clusters.append((cluster_name, cluster_hosts))
+
+            for cluster_name, cluster_conf in config.items():
                 cluster_hosts = {}
                 #get hosts in the cluster
-                for host_name in config[cluster_name].keys():
-                    metrics = []
-                    #collect metric for each host in the cluster
-                    for metric_name in config[cluster_name][host_name].keys():
-                        metric_def = {}
-                        metric_def['service_name'] = config[cluster_name][host_name][metric_name]['service_name']
-                        if 'crit_above' in config[cluster_name][host_name][metric_name].keys():
-                            metric_def['crit_above'] = config[cluster_name][host_name][metric_name]['crit_above']
-                            metric_def['crit_below'] = None
-                        if 'crit_below' in config[cluster_name][host_name][metric_name].keys():
-                            metric_def['crit_below'] = config[cluster_name][host_name][metric_name]['crit_below']
-                            metric_def['crit_above'] = None
-                        if 'warn_above' in config[cluster_name][host_name][metric_name].keys():
-                            metric_def['warn_above'] = config[cluster_name][host_name][metric_name]['warn_above']
-                            metric_def['warn_below'] = None
-                        if 'warn_below' in config[cluster_name][host_name][metric_name].keys():
-                            metric_def['warn_below'] = config[cluster_name][host_name][metric_name]['warn_below']
-                            metric_def['warn_above'] = None
-                        metrics.append((metric_name,metric_def))
+                for host_name, host_conf in cluster_conf.items():
+                    #collect metric for each host in the cluster, shared by
+                    #all the hosts of a group
+                    metrics = [(metric_name, self.rule(metric_conf)) for metric_name, metric_conf in host_conf.items()]
                     for host in host_name.split(','):
                         cluster_hosts.setdefault(host.lstrip(), []).append(metrics)
                 self.clusters.append((cluster_name,cluster_hosts))
+            self.cluster_table = match_index.compile_clusters(self.clusters)
+            self.aggregate_table = match_index.compile_aggregates(self.aggregates)
+            self.rules = {}
+            return True
 
-        except (ConfigObjError, IOError), e:
+        except (ConfigObjError, IOError, ValueError, SyntaxError, TypeError, KeyError, tokenize.TokenError, re.error), e:
             print 'Could not read  %s' % (e)
+            return False
+
+    # returns the ThresholdRule for the attributes of a metric, reusing
+    # an existing rule with the same service name and thresholds
+    def rule(self, metric_conf):
+        key = (metric_conf['service_name'],) + tuple([threshold(metric_conf.get(t)) for t in ('crit_above', 'crit_below', 'warn_above', 'warn_below')])
+        try:
+            return self.rules[key]
+        except KeyError:
+            metric_def = ThresholdRule(*key)
+            self.rules[key] = metric_def
+            return metric_def
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+#
+# config_cache - keeps the parsed and compiled configuration in a binary
+# file so the configuration is only parsed again when it changes
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+import conf_parser
+
+# increased whenever the attributes of ConfigParser change
+CACHE_VERSION = 11
+
+# errors that mean the cache is unreadable or was written by another
+# version of the code
+LOAD_ERRORS = (IOError, EOFError, cPickle.UnpicklingError, AttributeError, ImportError,
+               IndexError, KeyError, TypeError, ValueError)
+
+
+# Stores a conf_parser.ConfigParser, including the compiled cluster
+# tables, in cache_file.  The file starts with a small header holding
+# the path, mtime, size and SHA-1 of the configuration file it was
+# parsed from, so a stale cache is detected without reading the rest.
+class ConfigCache:
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+
+    # returns the cached ConfigParser, or None if there is no cache or
+    # config_file changed since it was written.  A file that was only
+    # touched is recognised by its SHA-1.
+    def load(self, config_file):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                header = cPickle.load(f)
+                if not isinstance(header, dict) or header.get('version') != CACHE_VERSION:
+                    return None
+                if header['path'] != os.path.abspath(config_file):
+                    return None
+                mtime, size, sha1 = header['source']
+                st = os.stat(config_file)
+                if (st.st_mtime, st.st_size) != (mtime, size):
+                    if st.st_size != size:
+                        return None
+                    with open(config_file, 'rb') as source:
+                        if hashlib.sha1(source.read()).hexdigest() != sha1:
+                            return None
+                config = cPickle.load(f)
+        except (OSError,) + LOAD_ERRORS:
+            return None
+        if not isinstance(config, conf_parser.ConfigParser):
+            return None
+        return config
+
+    # writes the cache atomically, so a concurrent reader never sees a
+    # partial file
+    def save(self, config, config_file):
+        header = {'version': CACHE_VERSION,
+                  'path': os.path.abspath(config_file),
+                  'source': config.source}
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp_name = tempfile.mkstemp(prefix='.config', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(config, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_name, self.cache_file)
+        except:
+            os.unlink(tmp_name)
+            raise
+
+
+# returns the configuration read from cache_file when it is current,
+# otherwise parses config_file and updates the cache.  Returns None if
+# config_file cannot be parsed.
+def load_config(config_file, cache_file=None):
+    cache = None
+    if cache_file is not None:
+        cache = ConfigCache(cache_file)
+        config = cache.load(config_file)
+        if config is not None:
+            return config
+    config = conf_parser.ConfigParser()
+    if not config.parse(config_file):
+        return None
+    if cache is not None:
+        try:
+            cache.save(config, config_file)
+        except (IOError, OSError), e:
+            logging.warn('Could not write %s: %s', cache_file, e)
+    return config
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+#
+# fake_gmetad - a local stand-in for the gmetad XML ports, used by the
+# tests
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import SocketServer
+import socket
+import threading
+
+
+class FakeGmetadHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        path = None
+        if self.server.interactive:
+            path = self.rfile.readline().strip()
+        self.server.requests.append(path)
+        response = self.server.respond(path)
+        if isinstance(response, basestring):
+            response = [response]
+        # a generator can stall between chunks like a slow gmetad
+        try:
+            for chunk in response:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except socket.error:
+            # the client gave up
+            pass
+
+
+# Serves Ganglia XML on a local port.  respond(path) returns the XML
+# for a request, or an iterable of the chunks to send, path is None unless interactive is set, in which case
+# the server first reads a request line like the gmetad interactive port.
+class FakeGmetad(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, respond, interactive=False):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), FakeGmetadHandler)
+        self.respond = respond
+        self.interactive = interactive
+        self.requests = []
+        self.port = self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+#
+# fake_io - stand-ins for the checkresult writer and the gmetad socket,
+# used by the tests
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+from cStringIO import StringIO
+
+
+# collects every call to the writer instead of writing a file, in the
+# place of GenerateNagiosCheckResult
+class RecordingWriter:
+    def __init__(self):
+        self.service_state = {0: 'OK', 1: 'WARNING', 2: 'CRITICAL', 3: 'UNKNOWN'}
+        self.calls = []
+
+    def build_host(self, *args):
+        self.calls.append(('host',) + args[1:])
+
+    def build_service(self, *args):
+        self.calls.append(('service',) + args[1:])
+
+    # the (host, service_name) of every service result, in order
+    def services(self):
+        return [call[1:3] for call in self.calls if call[0] == 'service']
+
+    # the return code, value and output of the last result of every
+    # service
+    def service_results(self):
+        results = {}
+        for call in self.calls:
+            if call[0] == 'service':
+                results[call[1:3]] = (call[12], call[13], call[15])
+        return results
+
+
+# returns the document in reads of at most chunk_size bytes
+class ChunkedReader:
+    def __init__(self, data, chunk_size):
+        self.data = StringIO(data)
+        self.chunk_size = chunk_size
+
+    def read(self, size=-1):
+        return self.data.read(self.chunk_size)
+
+    def close(self):
+        pass
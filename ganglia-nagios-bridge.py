@@ -21,15 +21,39 @@
 #
 ############################################################################
 
+import aggregates
 import argparse
+from cStringIO import StringIO
+import bridge_stats
+import logging
 import re
+import signal
 import socket
 import xml.sax
 import time
 import nagios_checkresult
-import conf_parser
+import config_cache
+import ganglia_sources
+import gmetad_query
+import match_index
+import nagios_inventory
+import poll_scheduler
+import spool_monitor
+import state_store
+import subtree_filter
+import xml_engines
+import xml_shards
+import xml_spool
 from pynag import Model
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this many metrics per host, plain Python evaluation is faster
+NUMPY_MIN_BATCH = 64
+
 # wrapper class so that the SAX parser can process data from a network
 # socket
 class SocketInputSource:
@@ -40,7 +64,10 @@ class SocketInputSource:
         return self
 
     def read(self, buf_size):
-        return self.socket.recv(buf_size)
+        return xml_spool.recv(self.socket, buf_size)
+
+    def close(self):
+        self.socket.close()
 
 
 # interprets metric values to generate service return codes
@@ -48,57 +75,137 @@ class PassiveGenerator:
     def __init__(self, force_dmax, tmax_grace):
         self.force_dmax = force_dmax
         self.tmax_grace = tmax_grace
+        # threshold arrays for the NumPy path, by tuple of rules
+        self.bounds_cache = {}
 
-    def process(self, metric_def, metric_value, metric_tn, metric_tmax, metric_dmax):
+    # true if the metric is older than TMAX + tmax_grace, or DMAX
+    def stale(self, metric_tn, metric_tmax, metric_dmax):
         effective_dmax = metric_dmax
         if(self.force_dmax > 0):
-            effective_dmax = force_dmax
+            effective_dmax = self.force_dmax
         effective_tmax = metric_tmax + self.tmax_grace
-        if effective_dmax > 0 and metric_tn > effective_dmax:
-            service_return_code = 3
-        elif metric_tn > effective_tmax:
+        return (effective_dmax > 0 and metric_tn > effective_dmax) or metric_tn > effective_tmax
+
+    def process(self, rule, metric_value, metric_tn, metric_tmax, metric_dmax):
+        if self.stale(metric_tn, metric_tmax, metric_dmax):
             service_return_code = 3
-        elif isinstance(metric_value, str):
+        elif isinstance(metric_value, basestring):
             service_return_code = 0
-        elif metric_def['crit_below'] is not None and metric_value < float(metric_def['crit_below']):
+        elif rule.crit_below is not None and metric_value < rule.crit_below:
             service_return_code = 2
-        elif metric_def['warn_below'] is not None and metric_value < float(metric_def['warn_below']):
+        elif rule.warn_below is not None and metric_value < rule.warn_below:
             service_return_code = 1
-        elif metric_def['crit_above'] is not None and metric_value > float(metric_def['crit_above']):
+        elif rule.crit_above is not None and metric_value > rule.crit_above:
             service_return_code = 2
-        elif metric_def['warn_above'] is not None and metric_value > float(metric_def['warn_above']):
+        elif rule.warn_above is not None and metric_value > rule.warn_above:
             service_return_code = 1
         else:
             service_return_code = 0
         return service_return_code
 
-# gets the hosts and services Nagios knows about
+    # Evaluates all the metrics collected for a host, metrics is a list
+    # of tuples starting with (rule, value, tn, tmax, dmax).  Returns the
+    # list of service return codes.  Large batches are evaluated with
+    # NumPy when it is installed.
+    def process_batch(self, metrics):
+        if numpy is not None and len(metrics) >= NUMPY_MIN_BATCH:
+            return self.process_numpy(metrics)
+        process = self.process
+        return [process(m[0], m[1], m[2], m[3], m[4]) for m in metrics]
+
+    def process_numpy(self, metrics):
+        rules = tuple([m[0] for m in metrics])
+        bounds = self.bounds_cache.get(rules)
+        if bounds is None:
+            # None becomes NaN, which never compares true
+            bounds = tuple([numpy.array([getattr(rule, name) for rule in rules], dtype=float)
+                            for name in ('crit_below', 'warn_below', 'crit_above', 'warn_above')])
+            if len(self.bounds_cache) >= 1024:
+                self.bounds_cache.clear()
+            self.bounds_cache[rules] = bounds
+        crit_below, warn_below, crit_above, warn_above = bounds
+        is_string = numpy.array([isinstance(m[1], basestring) for m in metrics])
+        values = numpy.array([numpy.nan if s else m[1] for m, s in zip(metrics, is_string)], dtype=float)
+        tn = numpy.array([m[2] for m in metrics])
+        tmax = numpy.array([m[3] for m in metrics]) + self.tmax_grace
+        if self.force_dmax > 0:
+            dmax = self.force_dmax
+        else:
+            dmax = numpy.array([m[4] for m in metrics])
+        stale = ((dmax > 0) & (tn > dmax)) | (tn > tmax)
+        with numpy.errstate(invalid='ignore'):
+            codes = numpy.select([stale, is_string, values < crit_below, values < warn_below,
+                                  values > crit_above, values > warn_above],
+                                 [3, 0, 2, 1, 2, 1], default=0)
+        return codes.tolist()
+
+# gets the hosts and services Nagios knows about, using the inventory
+# cache if one is configured and still matches the Nagios configuration
 class NagiosHosts:
-    def __init__(self):
-        self.host_service = []
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.inventory = None
+        self.fingerprint = None
+
+    # all the Nagios configuration files the inventory depends on
+    def config_files(self):
+        Model.config.parse_maincfg()
+        return [Model.config.cfg_file] + Model.config.get_cfg_files()
+
+    # returns True if the Nagios configuration changed since process()
+    def changed(self):
+        return poll_scheduler.fingerprint(self.config_files()) != self.fingerprint
 
     def process(self):
+        self.fingerprint = poll_scheduler.fingerprint(self.config_files())
+        cache = None
+        if self.cache_file:
+            cache = nagios_inventory.InventoryCache(self.cache_file)
+            self.inventory = cache.load(self.fingerprint)
+            if self.inventory is not None:
+                return
+        inventory = nagios_inventory.NagiosInventory()
         all_hosts = Model.Host.objects.all
         for host in all_hosts:
             service_name = []
             for service in host.get_effective_services():
                 service_name.append(service.service_description)
-            self.host_service.append((host.host_name, service_name))
+            inventory.add(host.host_name, service_name)
+        self.inventory = inventory
+        if cache is not None:
+            try:
+                cache.save(inventory, self.fingerprint)
+            except (IOError, OSError) as e:
+                logging.warn('Failed to write Nagios inventory cache %s: %s', self.cache_file, e)
 
 
 # SAX event handler for parsing the Ganglia XML stream
 class GangliaHandler(xml.sax.ContentHandler):
-    def __init__(self, clusters_c, value_handler, checkresult_file_handler, strip_domains, nagios_hosts):
-        self.clusters_c = clusters_c
+    def __init__(self, match_index, value_handler, checkresult_file_handler, strip_domains, state_store=None):
+        self.match_index = match_index
         self.value_handler = value_handler
         self.checkresult_file_handler = checkresult_file_handler
-        self.clusters_cache = {}
-        self.hosts_cache = {}
-        self.metrics_cache = {}
         self.strip_domains = strip_domains
-        self.host_service = nagios_hosts.host_service
+        # if set, only results that changed are written
+        self.state_store = state_store
+        self.host_tables = ()
+        self.host_match = None
+        # aggregates of the current cluster and their accumulators
+        self.aggregate_tables = ()
+        self.accumulators = {}
+        self.accumulator_list = []
+        # metrics of the current host, evaluated when the host ends
+        self.pending = []
+        # counters and timers collected into BridgeStats
+        self.elements = 0
+        self.metrics_matched = 0
+        self.metrics_unknown = 0
+        self.results_written = 0
+        self.evaluate_time = 0.0
+        self.write_time = 0.0
 
     def startElement(self, name, attrs):
+        self.elements += 1
 
         # METRIC is the most common element, it is handled first,
         # followed by HOST and CLUSTER
@@ -110,73 +217,44 @@ class GangliaHandler(xml.sax.ContentHandler):
             return
 
         # handle a METRIC element in the XML
-        if name == "METRIC" and self.metrics is not None:
-            metric_name = attrs['NAME']
-            cache_key = (self.cluster_idx, self.host_idx, metric_name)
-            if cache_key in self.metrics_cache:
-                metric_info = self.metrics_cache[cache_key]
-                self.metric_idx = metric_info[0]
-                service_name = metric_info[1]
-                self.metric = self.clusters_c[self.cluster_idx][1][self.host_idx][1][self.metric_idx][1]
-                self.handle_metric(metric_name, service_name, attrs)
-                return
-            for idx, metric_def in enumerate(self.metrics):
-                match_result = metric_def[0] == metric_name
-                if match_result:
-                    service_name = metric_def[1]['service_name']
-                    # if service is defined in Nagios for host_name
-                    if service_name in self.nagios_service:
-                        self.metrics_cache[cache_key] = (idx, service_name)
-                        self.metric = metric_def[1]
-                        self.handle_metric(metric_name, service_name, attrs)
-                        return
+        if name == "METRIC":
+            if self.aggregate_tables:
+                self.aggregate_metric(attrs)
+            if self.host_match is not None:
+                metric_name = attrs['NAME']
+                found = self.host_match.metric(metric_name)
+                if found is not None:
+                    self.handle_metric(found[0], found[1], attrs)
+            return
 
         # handle a HOST element in the XML
         if name == "HOST":
-            self.metrics = None
-            if self.hosts is not None:
-                self.host_name = attrs['NAME']
-                self.host_reported = long(attrs['REPORTED'])
-                self.nagios_service = None
+            self.end_host()
+            if self.host_tables:
+                host_name = attrs['NAME']
                 if self.strip_domains:
-                    self.host_name = self.host_name.partition('.')[0]
-                cache_key = (self.cluster_idx, self.host_name)
-                if cache_key in self.hosts_cache:
-                    self.host_ix = self.hosts_cache[cache_key]
-                    self.metrics = self.clusters_c[self.cluster_idx][1][self.host_idx][1]
+                    host_name = host_name.partition('.')[0]
+                # only hosts that are configured and known to Nagios
+                self.host_match = self.match_index.host(self.host_tables, host_name)
+                if self.host_match is not None:
+                    self.host_name = host_name
                     self.handle_host(host_name, attrs)
-                    return
-                for idx, host_def in enumerate(self.hosts):
-                    if host_def[0] == self.host_name:
-                        for host in self.host_service:
-                            if host[0] == self.host_name:
-                                self.hosts_cache[cache_key] = idx
-                                self.host_idx = idx
-                                self.metrics = []
-                                for metric_tuple in host_def[1]:
-                                    self.metrics += metric_tuple
-                                self.handle_host(self.host_name, attrs)
-                                # get the services defined for the host in Nagios
-                                self.nagios_service = host[1]
-                                return
+            return
 
         # handle a CLUSTER element in the XML
         if name == "CLUSTER":
-            self.hosts = None
+            self.end_host()
             self.cluster_name = attrs['NAME']
             self.cluster_localtime = long(attrs['LOCALTIME'])
-            if self.cluster_name in self.clusters_cache:
-                self.cluster_idx = self.clusters_cache[self.cluster_name]
-                self.hosts = self.clusters_c[self.cluster_idx][1]
-                return
-            for idx, cluster_def in enumerate(self.clusters_c):
-                if cluster_def[0] == self.cluster_name:
-                    self.clusters_cache[self.cluster_name] = idx
-                    self.cluster_idx = idx
-                    self.hosts = []
-                    for host_name in cluster_def[1]:
-                        self.hosts.append((host_name, cluster_def[1][host_name]))
-                    return
+            # the checkresult timestamp is informational, it is not
+            # worth formatting it again for every host and metric
+            self.checkresult_time = time.asctime()
+            self.now = int(time.time())
+            self.host_tables = self.match_index.cluster(self.cluster_name)
+            self.aggregate_tables = self.match_index.cluster_aggregates(self.cluster_name)
+            self.accumulators = {}
+            self.accumulator_list = []
+            return
 
     # checks the state of host by comparing tmax and tn for the host
     def handle_host(self, host_name, attrs):
@@ -187,12 +265,25 @@ class GangliaHandler(xml.sax.ContentHandler):
             host_return_code = 1        #host down
         else:
             host_return_code = 0        #host up
-        host_last_seen = str(last_seen) + '.0'
+        if self.state_store is not None and not self.state_store.should_emit(self.host_name, '', host_return_code, self.now):
+            return
+        host_last_seen = '%d.0' % last_seen
 
         # write host checks to Nagios checkresult file
-        self.checkresult_file_handler.build_host(time.asctime(), self.host_name, 0, 0, 1, 1, 0.1, host_last_seen, host_last_seen, 0, 1, host_return_code,"")
+        self.results_written += 1
+        self.checkresult_file_handler.build_host(self.checkresult_time, self.host_name, 0, 0, 1, 1, 0.1, host_last_seen, host_last_seen, 0, 1, host_return_code,"")
+
+    def endElement(self, name):
+        if name == "HOST":
+            self.end_host()
+        elif name == "CLUSTER":
+            self.end_cluster()
+
+    def endDocument(self):
+        self.end_host()
 
-    def handle_metric(self, metric_name, service_name, attrs):
+    # collects a metric of the current host for evaluation
+    def handle_metric(self, rule, service_name, attrs):
         # extract the metric attributes
         metric_value_raw = attrs['VAL']
         metric_tn = int(attrs['TN'])
@@ -207,59 +298,399 @@ class GangliaHandler(xml.sax.ContentHandler):
             metric_value = float(metric_value_raw)
         else:
             metric_value = int(metric_value_raw)
-        last_seen = self.cluster_localtime - metric_tn
-        service_last_seen = str(last_seen) + '.0'
+        self.pending.append((rule, metric_value, metric_tn, metric_tmax, metric_dmax, service_name, metric_units))
 
-        #setting service return code as 0 by default
-        service_return_code=0
-        # call the handler to process the value and return service state after comparing metric value and threshold:
-        service_return_code = self.value_handler.process(self.metric, metric_value, metric_tn, metric_tmax, metric_dmax)
-        # write Passive service checks to checkresult file
-        self.checkresult_file_handler.build_service(time.asctime(), self.host_name, service_name, 0, 0, 1, 1, 0.1, service_last_seen, service_last_seen, 0, 1, service_return_code, metric_value, metric_units,"")
+    # evaluates the metrics collected for the current host and writes
+    # the service checks
+    def end_host(self):
+        if self.host_match is None:
+            return
+        self.metrics_unknown += self.host_match.unknown
+        self.host_match = None
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = []
+        self.metrics_matched += len(pending)
+        start = time.time()
+        # call the handler to process the values and return service states after comparing metric values and thresholds:
+        service_return_codes = self.value_handler.process_batch(pending)
+        evaluated = time.time()
+        for metric, service_return_code in zip(pending, service_return_codes):
+            rule, metric_value, metric_tn, metric_tmax, metric_dmax, service_name, metric_units = metric
+            if self.state_store is not None and not self.state_store.should_emit(self.host_name, service_name, service_return_code, self.now):
+                continue
+            last_seen = self.cluster_localtime - metric_tn
+            service_last_seen = '%d.0' % last_seen
+            # write Passive service checks to checkresult file
+            self.results_written += 1
+            self.checkresult_file_handler.build_service(self.checkresult_time, self.host_name, service_name, 0, 0, 1, 1, 0.1, service_last_seen, service_last_seen, 0, 1, service_return_code, metric_value, metric_units,"")
+        self.evaluate_time += evaluated - start
+        self.write_time += time.time() - evaluated
 
+    # Adds the value of a metric of any host in the cluster to the
+    # aggregates of the metric.  String and stale values are left out,
+    # an aggregate without any value is reported as UNKNOWN.
+    def aggregate_metric(self, attrs):
+        metric_name = attrs['NAME']
+        candidates = ()
+        for metric_table in self.aggregate_tables:
+            candidates += metric_table.candidates(metric_name)
+        if not candidates:
+            return
+        metric_value = None
+        if attrs['TYPE'] != 'string' and not self.value_handler.stale(int(attrs['TN']), int(attrs['TMAX']), int(attrs['DMAX'])):
+            metric_value = float(attrs['VAL'])
+        for aggregate, service_name in candidates:
+            key = (aggregate, service_name)
+            accumulator = self.accumulators.get(key)
+            if accumulator is None:
+                accumulator = aggregates.Accumulator(aggregate, service_name)
+                self.accumulators[key] = accumulator
+                self.accumulator_list.append(accumulator)
+            if metric_value is not None:
+                accumulator.add(metric_value, attrs['UNITS'])
 
+    # writes a service check for every aggregate of the cluster
+    def end_cluster(self):
+        self.end_host()
+        accumulator_list = self.accumulator_list
+        self.accumulators = {}
+        self.accumulator_list = []
+        self.aggregate_tables = ()
+        last_seen = '%d.0' % self.cluster_localtime
+        for accumulator in accumulator_list:
+            host_name = accumulator.aggregate.host_name or self.cluster_name
+            if (host_name, accumulator.service_name) not in self.match_index.nagios_inventory:
+                self.metrics_unknown += 1
+                continue
+            value = accumulator.value()
+            if value is None:
+                return_code = 3
+            else:
+                return_code = self.value_handler.process(accumulator.aggregate, value, 0, 0, 0)
+            if self.state_store is not None and not self.state_store.should_emit(host_name, accumulator.service_name, return_code, self.now):
+                continue
+            output = accumulator.output(self.checkresult_file_handler.service_state[return_code], value)
+            self.results_written += 1
+            self.checkresult_file_handler.build_service(self.checkresult_time, host_name, accumulator.service_name, 0, 0, 1, 1, 0.1, last_seen, last_seen, 0, 1, return_code, value, accumulator.units, output)
 
-# main program code
-if __name__ == '__main__':
-    try:
-        # parse command line
-        parser = argparse.ArgumentParser(description='read Ganglia XML and generate Nagios check results file')
-        parser.add_argument('config_file', nargs='?',
-                            help='configuration file', default='/etc/ganglia/ganglia-nagios-bridge.conf')
-        args = parser.parse_args()
+    # adds the counters and timers of this handler to a BridgeStats
+    def update_stats(self, stats):
+        stats.count('elements', self.elements)
+        stats.count('metrics_matched', self.metrics_matched)
+        stats.count('metrics_unknown_to_nagios', self.metrics_unknown)
+        stats.count('results_written', self.results_written)
+        stats.add_time('evaluate', self.evaluate_time)
+        stats.add_time('write', self.write_time)
 
-        # read the configuration file, setting some defaults first
-        force_dmax = 0
-        tmax_grace = 60
-        #pasre config file
-        config_parse = conf_parser.ConfigParser()
-        config_parse.parse(args.config_file)
 
-        #get hosts and associated services known to Nagios to prevent generating checkresult for hosts not known to Nagios
-        nagios_hosts = NagiosHosts()
-        nagios_hosts.process()
+# Holds the parsed configuration, the compiled match index and the
+# Nagios inventory so that a daemon can reuse them between polls.
+# They are only reloaded when a file changes or on SIGHUP.
+class Bridge:
+    def __init__(self, config_file, value_handler=None, config_cache_file=None):
+        self.config_file = config_file
+        self.config_cache_file = config_cache_file
+        # unless one is given, the value handler is built from the
+        # configuration every time it is loaded
+        self.fixed_value_handler = value_handler
+        self.value_handler = value_handler
+        self.config_watch = poll_scheduler.FileWatcher([config_file])
+        self.reload_requested = False
+        self.config = None
+        self.nagios_hosts = None
+        self.index = None
+        self.source_status = []
+        self.stats = None
+        self.spool_monitor = None
+
+    def request_reload(self, signum=None, frame=None):
+        self.reload_requested = True
+
+    def load(self):
+        force = self.reload_requested
+        self.reload_requested = False
+        config_changed = force or self.config is None or self.config_watch.changed()
+        nagios_changed = force or self.nagios_hosts is None or self.nagios_hosts.changed()
+        if config_changed:
+            config_parse = config_cache.load_config(self.config_file, self.config_cache_file)
+            if config_parse is not None:
+                self.config = config_parse
+            elif self.config is None:
+                raise IOError('Failed to read configuration file %s' % self.config_file)
+            else:
+                logging.warn('Keeping previous configuration, failed to read %s', self.config_file)
+                config_changed = False
+            if config_changed and self.config.parse_processes > 1 and self.config.suppress_unchanged:
+                logging.warn('parse_processes is ignored when suppress_unchanged is set')
+            if config_changed:
+                self.spool_monitor = self.create_spool_monitor(self.config)
+                if self.fixed_value_handler is None:
+                    self.value_handler = PassiveGenerator(self.config.force_dmax, self.config.tmax_grace)
+        if nagios_changed:
+            #get hosts and associated services known to Nagios to prevent generating checkresult for hosts not known to Nagios
+            nagios_hosts = NagiosHosts(self.config.nagios_inventory_cache)
+            nagios_hosts.process()
+            self.nagios_hosts = nagios_hosts
+        if config_changed or nagios_changed:
+            self.index = match_index.MatchIndex(self.config.cluster_table, self.nagios_hosts.inventory, self.config.aggregate_table)
+
+    # the ledger of the files written is only kept when a limit is set
+    def create_spool_monitor(self, config_parse):
+        ledger_file = None
+        if config_parse.checkresult_max_backlog > 0 or config_parse.checkresult_max_age > 0:
+            ledger_file = config_parse.checkresult_ledger
+        return spool_monitor.SpoolMonitor(config_parse.nagios_result_dir, ledger_file,
+                                          config_parse.checkresult_max_backlog, config_parse.checkresult_max_age,
+                                          config_parse.checkresult_max_backoff)
 
+    # returns the XML documents read from one gmetad or gmond
+    def fetch_source(self, gmetad_host, gmetad_port):
+        config_parse = self.config
+        if config_parse.gmetad_query:
+            # aggregates need every host of their clusters
+            clusters = config_parse.clusters + [(cluster_name, {'.*': []}) for cluster_name, metric_name, aggregate in config_parse.aggregates]
+            paths = gmetad_query.query_paths(clusters, config_parse.strip_domains, config_parse.gmetad_query_max_hosts)
+            if paths is not None:
+                return gmetad_query.fetch_all(gmetad_host, config_parse.gmetad_query_port, paths,
+                                              config_parse.spool_max_memory, config_parse.gmetad_query_parallel,
+                                              config_parse.gmetad_timeout)
+            logging.info('Cluster name patterns are configured, requesting the full grid')
         # connect to the gmetad or gmond
-        sock = socket.create_connection((config_parse.gmetad_host, config_parse.gmetad_port))
-        # set up the SAX parser
-        parser = xml.sax.make_parser()
-        pg = PassiveGenerator(force_dmax, tmax_grace)
+        sock = socket.create_connection((gmetad_host, gmetad_port), config_parse.gmetad_timeout)
+        # several sources are read at the same time, so they are always
+        # spooled before parsing, as is XML split between processes
+        if config_parse.spool_xml or len(config_parse.gmetad_sources) > 1 or config_parse.parse_processes > 1:
+            # read all the XML before parsing, closing the connection
+            spool = xml_spool.XMLSpool(config_parse.spool_max_memory)
+            source = spool.drain(sock)
+            logging.info('Received %d bytes from %s:%s, connection held for %.3f seconds',
+                         spool.bytes_received, gmetad_host, gmetad_port, spool.connection_time)
+            return [source]
+        return [SocketInputSource(sock)]
+
+    # polls Ganglia once and writes a checkresult file
+    def run_cycle(self):
+        stats = bridge_stats.BridgeStats()
+        self.stats = stats
+        with stats.phase('inventory'):
+            self.load()
+        config_parse = self.config
+        try:
+            self.process(stats)
+        finally:
+            if config_parse.stats_file:
+                try:
+                    stats.write_json(config_parse.stats_file)
+                except (IOError, OSError) as e:
+                    logging.warn('Failed to write %s: %s', config_parse.stats_file, e)
+
+    def process(self, stats):
+        config_parse = self.config
+        with stats.phase('connect'):
+            self.source_status = ganglia_sources.poll(config_parse.gmetad_sources, self.fetch_source)
+        for status in self.source_status:
+            stats.sources[status.name] = {'elapsed': status.elapsed, 'error': status.error and str(status.error)}
+        failed = [status for status in self.source_status if status.error is not None]
+        for status in failed:
+            logging.warn('Failed to poll %s after %.3f seconds: %s', status.name, status.elapsed, status.error)
+        if len(failed) == len(self.source_status):
+            raise failed[0].error
         #Instantiate GenerateNagiosCheckResult class
         gn = nagios_checkresult.GenerateNagiosCheckResult()
+        last_states = None
+        shard_files = []
+        # until the files reach Nagios, a failure removes them
+        handed_over = False
         #Create CheckResultFile
         try:
-            gn.create(config_parse.nagios_result_dir, int(time.time()))
-            parser.setContentHandler(GangliaHandler(config_parse.clusters, pg, gn, config_parse.strip_domains, nagios_hosts))
-            # run the main program loop
-            parser.parse(SocketInputSource(sock))
+            if config_parse.suppress_unchanged:
+                last_states = state_store.LastStateStore(config_parse.state_file, config_parse.state_refresh * 60)
+            # while Nagios is behind, the files of this poll are only
+            # handed over once merged with the unread ones
+            monitor = self.spool_monitor
+            pressure = monitor.measure()
+            stats.gauges['checkresult_backlog'] = monitor.backlog
+            stats.gauges['checkresult_backlog_age'] = monitor.backlog_age
+            if pressure:
+                logging.warn('%d checkresult files waiting for Nagios, the oldest for %d seconds, coalescing results',
+                             monitor.backlog, monitor.backlog_age)
+            gn.create(config_parse.nagios_result_dir, int(time.time()), config_parse.checkresult_max_records, defer_ok=pressure)
+            handler = GangliaHandler(self.index, self.value_handler, gn, config_parse.strip_domains, last_states)
+            # the state store cannot be shared between processes
+            sharded = config_parse.parse_processes > 1 and last_states is None
+            parse_start = time.time()
+            for status in self.source_status:
+                start = time.time()
+                for source in status.documents:
+                    document = bridge_stats.CountingReader(source, stats)
+                    if sharded:
+                        data = document.read()
+                        files = self.parse_sharded(data, stats, gn.file_time, status.name)
+                        if files is not None:
+                            shard_files.extend(files)
+                            continue
+                        # not split at CLUSTER boundaries, parse it here
+                        document = StringIO(data)
+                    self.parse_document(handler, document, stats, status.name)
+                if status.error is None:
+                    logging.info('Polled %s in %.3f seconds, parsed in %.3f seconds',
+                                 status.name, status.elapsed, time.time() - start)
+            # every shard succeeded, hand their files over to Nagios
+            if not pressure:
+                nagios_checkresult.write_ok_files(shard_files)
+            handler.update_stats(stats)
+            stats.add_time('parse', time.time() - parse_start - handler.evaluate_time - handler.write_time)
 
-            # write out for Nagios
-            gn.submit()
+            # report on the bridge itself
+            if config_parse.stats_host:
+                stats.emit_check(gn, config_parse.stats_host, config_parse.stats_service,
+                                 config_parse.stats_warn, config_parse.stats_crit)
 
-            # all done
-            sock.close()
+            # write out for Nagios
+            with stats.phase('write'):
+                if pressure:
+                    gn.close_file()
+                    cmd_files, coalesced = monitor.coalesce(shard_files + gn.cmd_files, gn.file_time,
+                                                            config_parse.checkresult_max_records)
+                    stats.count('results_coalesced', coalesced)
+                else:
+                    gn.submit()
+                handed_over = True
+                # the results reached Nagios, only now are the states
+                # they report remembered
+                if last_states is not None:
+                    last_states.commit()
+                if not pressure:
+                    monitor.record(shard_files + gn.cmd_files)
         except OSError as e:
             print "Failed to create tempfile at", config_parse.nagios_result_dir
+        finally:
+            if not handed_over:
+                gn.discard()
+                nagios_checkresult.remove_files(shard_files)
+            # all done
+            for status in self.source_status:
+                for source in status.documents:
+                    source.close()
+            if last_states is not None:
+                last_states.close()
+
+    # parses one document with handler in this process
+    def parse_document(self, handler, document, stats, source_name):
+        config_parse = self.config
+        if config_parse.skip_unmonitored:
+            document = subtree_filter.SubtreeFilter(document, self.index, config_parse.strip_domains)
+        # run the main program loop
+        try:
+            xml_engines.ENGINES[config_parse.xml_engine](document, handler)
+        except xml_engines.PARSE_ERRORS as e:
+            logging.warn('Invalid XML from %s: %s', source_name, e)
+        if config_parse.skip_unmonitored:
+            stats.count('subtrees_skipped', document.skipped)
+
+    # Parses the XML in data in parse_processes processes, split at
+    # CLUSTER boundaries.  Each process writes its own checkresult files
+    # without handing them over to Nagios; the files are returned so the
+    # caller can write their ok-to-go indicators once every document is
+    # done.  If a process fails, the files of all of them are removed.
+    # Returns None if data cannot be split.
+    def parse_sharded(self, data, stats, file_time, source_name):
+        config_parse = self.config
+        # runs in the pool processes
+        def parse_shard(document):
+            shard_stats = bridge_stats.BridgeStats()
+            gn = nagios_checkresult.GenerateNagiosCheckResult()
+            try:
+                gn.create(config_parse.nagios_result_dir, file_time, config_parse.checkresult_max_records, defer_ok=True)
+                handler = GangliaHandler(self.index, self.value_handler, gn, config_parse.strip_domains)
+                self.parse_document(handler, document, shard_stats, source_name)
+                handler.update_stats(shard_stats)
+                gn.close_file()
+            except Exception as e:
+                gn.discard()
+                return {'error': '%s: %s' % (e.__class__.__name__, e)}
+            return {'error': None, 'files': gn.cmd_files,
+                    'counters': shard_stats.counters, 'phases': shard_stats.phases}
+        results = xml_shards.map_shards(data, parse_shard, config_parse.parse_processes)
+        if results is None:
+            return None
+        files = []
+        errors = []
+        for result in results:
+            if result['error'] is None:
+                files.extend(result['files'])
+                # the time evaluating and writing is summed over the processes
+                stats.merge(result['counters'], result['phases'])
+            else:
+                errors.append(result['error'])
+        if errors:
+            nagios_checkresult.remove_files(files)
+            raise RuntimeError('Failed to parse %d of %d shards from %s: %s' % (len(errors), len(results), source_name, errors[0]))
+        logging.info('Parsed %s in %d shards', source_name, len(results))
+        return files
+
+    # runs run_cycle() every poll_interval seconds until SIGTERM/SIGINT
+    def run_daemon(self, interval=None):
+        self.load()
+        if interval is None:
+            interval = self.config.poll_interval
+        scheduler = poll_scheduler.PollScheduler(interval)
+        def stop(signum, frame):
+            scheduler.stop()
+        self.install_signal_handlers(stop)
+        def cycle():
+            self.safe_cycle()
+            # poll less often while Nagios is behind reading the results
+            if scheduler.interval != interval * self.spool_monitor.backoff:
+                scheduler.interval = interval * self.spool_monitor.backoff
+                logging.info('Polling every %s seconds', scheduler.interval)
+        scheduler.run(cycle)
+
+    # SIGHUP reloads, SIGTERM and SIGINT call stop.  The handlers only
+    # set a flag, so the system calls of a poll they interrupt are
+    # restarted rather than failing the poll.
+    def install_signal_handlers(self, stop):
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.siginterrupt(signum, False)
+
+    # a failed poll must not stop the daemon
+    def safe_cycle(self):
+        try:
+            self.run_cycle()
+        except socket.timeout as e:
+            logging.warn('Timed out waiting for gmetad after %s seconds', self.config.gmetad_timeout)
+        except socket.error as e:
+            logging.warn('Failed to poll gmetad: %s', e)
+        except Exception:
+            logging.exception('Poll cycle failed')
+
+
+# main program code
+if __name__ == '__main__':
+    try:
+        # parse command line
+        parser = argparse.ArgumentParser(description='read Ganglia XML and generate Nagios check results file')
+        parser.add_argument('config_file', nargs='?',
+                            help='configuration file', default='/etc/ganglia/ganglia-nagios-bridge.conf')
+        parser.add_argument('--daemon', action='store_true',
+                            help='keep running and poll every poll_interval seconds')
+        parser.add_argument('--interval', type=float,
+                            help='override poll_interval from the configuration file')
+        parser.add_argument('--config-cache',
+                            help='keep the parsed configuration in this file, parsing the configuration file again only when it changes')
+        args = parser.parse_args()
+
+        # force_dmax and tmax_grace are read from the configuration file
+        bridge = Bridge(args.config_file, None, args.config_cache)
+        if args.daemon:
+            bridge.run_daemon(args.interval)
+        else:
+            bridge.run_cycle()
 
     except socket.error as e:
         logging.warn('Failed to connect to gmetad: %s', e.strerror)
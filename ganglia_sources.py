@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# ganglia_sources - polls several gmetad or gmond servers at the same
+# time, so that a failure or a slow server does not hold up the others
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import time
+from multiprocessing.pool import ThreadPool
+
+
+# converts 'host:port' or 'host' strings to (host, port) tuples
+def parse_source_list(sources, default_port):
+    result = []
+    for source in sources:
+        source = source.strip()
+        host, sep, port = source.rpartition(':')
+        if sep and port.isdigit():
+            result.append((host, int(port)))
+        else:
+            result.append((source, int(default_port)))
+    return result
+
+
+# outcome of polling one source
+class SourceStatus:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.name = '%s:%s' % (host, port)
+        self.documents = []
+        self.error = None
+        self.elapsed = 0.0
+
+
+# Calls fetch_source(host, port) for every source, all at the same
+# time, and returns a SourceStatus for each in the same order.
+# fetch_source returns the list of XML documents read from the source.
+def poll(sources, fetch_source):
+    def poll_one(source):
+        status = SourceStatus(source[0], source[1])
+        start = time.time()
+        try:
+            status.documents = fetch_source(source[0], source[1])
+        except EnvironmentError as e:
+            status.error = e
+        status.elapsed = time.time() - start
+        return status
+    if len(sources) <= 1:
+        return [poll_one(source) for source in sources]
+    pool = ThreadPool(len(sources))
+    try:
+        return pool.map(poll_one, sources)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+#
+# gmetad_query - requests only the configured clusters and hosts from
+# the interactive port of gmetad instead of the complete grid
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import socket
+from multiprocessing.pool import ThreadPool
+import match_index
+import xml_spool
+
+
+# Returns the gmetad query paths covering the configured clusters, or
+# None if a full dump is needed because a cluster name is a pattern.
+# A cluster is requested host by host if it has at most
+# max_hosts exact host names.  Host names are not used in the paths
+# if strip_domains is set, as the names in Ganglia have a domain.
+def query_paths(clusters, strip_domains, max_hosts):
+    # a cluster may be listed more than once, it is requested once
+    cluster_names = []
+    hosts = {}
+    for cluster_name, cluster_hosts in clusters:
+        if match_index.is_pattern(cluster_name):
+            return None
+        if cluster_name not in hosts:
+            cluster_names.append(cluster_name)
+            hosts[cluster_name] = set()
+        hosts[cluster_name].update(cluster_hosts.keys())
+    paths = []
+    for cluster_name in cluster_names:
+        host_names = sorted(hosts[cluster_name])
+        by_host = not strip_domains and len(host_names) <= max_hosts
+        for host_name in host_names:
+            if match_index.is_pattern(host_name):
+                by_host = False
+        if by_host:
+            for host_name in host_names:
+                paths.append('/%s/%s' % (cluster_name, host_name))
+        else:
+            paths.append('/' + cluster_name)
+    return paths
+
+
+# Sends one path request to gmetad and returns a file object with the
+# XML response
+def fetch(gmetad_host, gmetad_port, path, max_memory, timeout=None):
+    sock = socket.create_connection((gmetad_host, gmetad_port), timeout)
+    try:
+        sock.sendall(path + '\n')
+    except:
+        sock.close()
+        raise
+    return xml_spool.XMLSpool(max_memory).drain(sock)
+
+
+# Fetches all the paths using up to parallel connections at a time,
+# returning the responses in the same order as paths
+def fetch_all(gmetad_host, gmetad_port, paths, max_memory, parallel=1, timeout=None):
+    def fetch_path(path):
+        return fetch(gmetad_host, gmetad_port, path, max_memory, timeout)
+    if parallel <= 1 or len(paths) <= 1:
+        return [fetch_path(path) for path in paths]
+    pool = ThreadPool(min(parallel, len(paths)))
+    try:
+        return pool.map(fetch_path, paths)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+# match_index - compiled lookup tables that resolve Ganglia cluster, host
+# and metric names against the bridge configuration and the Nagios
+# inventory
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import re
+
+# a configured name containing any of these characters is compiled as a
+# regular expression, anything else is looked up as an exact name.
+# '.' on its own is not included as it is common in host names.
+PATTERN_CHARS = frozenset('^$*+?{}[]\\|()')
+
+# the number of names a NameTable remembers the lookups of
+MAX_RESOLVED = 200000
+
+
+def is_pattern(name):
+    for c in name:
+        if c in PATTERN_CHARS:
+            return True
+    return False
+
+
+# Maps names to values: exact names are kept in a dict, patterns in a
+# list of precompiled regexes that must match the whole name.  A pattern
+# is also kept as an exact name, so a name like 'Web (EU)' still
+# matches itself.
+# Results of lookup() are memoised so every distinct name only walks
+# the pattern list once.  Unless keep_matches is set, the matches are
+# dropped and names with the same values share one result, so a
+# pattern matching 100k hosts costs a dict entry per host.  A daemon
+# sees hosts come and go, including hosts that are not monitored, so
+# the memo is cleared once it holds max_resolved names: the next polls
+# walk the patterns again for the names still reported.
+class NameTable:
+    def __init__(self, keep_matches=True, max_resolved=MAX_RESOLVED):
+        self.exact = {}
+        self.patterns = []
+        self.resolved = {}
+        self.keep_matches = keep_matches
+        self.max_resolved = max_resolved
+        self.results = {}
+
+    def add(self, name, value):
+        if is_pattern(name):
+            try:
+                regex = re.compile(r'(?:%s)\Z' % name)
+            except re.error as e:
+                raise re.error('invalid pattern %s: %s' % (name, e))
+            self.patterns.append((regex, value, name))
+        self.exact.setdefault(name, value)
+        self.resolved = {}
+        self.results = {}
+
+    # returns a tuple of (value, match) pairs, the exact entry first
+    # followed by matching patterns in configuration order.  match is
+    # None for the exact entry.
+    def lookup(self, name):
+        try:
+            return self.resolved[name]
+        except KeyError:
+            pass
+        found = []
+        if name in self.exact:
+            found.append((self.exact[name], None))
+        for regex, value, pattern in self.patterns:
+            # already found as an exact name
+            if pattern == name:
+                continue
+            match = regex.match(name)
+            if match is not None:
+                if not self.keep_matches:
+                    match = None
+                found.append((value, match))
+        found = tuple(found)
+        if len(self.resolved) >= self.max_resolved:
+            self.resolved = {}
+            self.results = {}
+        if not self.keep_matches:
+            found = self.results.setdefault(found, found)
+        self.resolved[name] = found
+        return found
+
+    # the memoised lookups are not pickled with the table
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['resolved'] = {}
+        state['results'] = {}
+        return state
+
+
+# Table of metric definitions for a host entry, resolving a metric name
+# to its candidate (ThresholdRule, service_name) pairs.  Positional
+# placeholders in the service_name of a pattern are expanded here.
+class MetricTable(NameTable):
+    def __init__(self):
+        NameTable.__init__(self)
+        self.services = {}
+
+    def add(self, name, value):
+        NameTable.add(self, name, value)
+        self.services = {}
+
+    def candidates(self, metric_name):
+        try:
+            return self.services[metric_name]
+        except KeyError:
+            pass
+        found = []
+        for metric_def, match in self.lookup(metric_name):
+            service_name = metric_def.service_name
+            if match is not None:
+                service_name = match.expand(service_name)
+            found.append((metric_def, service_name))
+        found = tuple(found)
+        self.services[metric_name] = found
+        return found
+
+    def __getstate__(self):
+        state = NameTable.__getstate__(self)
+        state['services'] = {}
+        return state
+
+
+# Builds the cluster -> host -> metric tables from ConfigParser.clusters.
+# Hosts sharing the same metric lists, as the hosts of a group do, share
+# one MetricTable.
+def compile_clusters(clusters):
+    cluster_table = NameTable(False)
+    metric_tables = {}
+    for cluster_name, cluster_hosts in clusters:
+        host_table = NameTable(False)
+        for host_name, metric_lists in cluster_hosts.items():
+            key = tuple([id(metrics) for metrics in metric_lists])
+            metric_table = metric_tables.get(key)
+            if metric_table is None:
+                metric_table = MetricTable()
+                for metrics in metric_lists:
+                    for metric_name, metric_def in metrics:
+                        metric_table.add(metric_name, metric_def)
+                metric_tables[key] = metric_table
+            host_table.add(host_name, metric_table)
+        cluster_table.add(cluster_name, host_table)
+    return cluster_table
+
+
+# Table of the aggregates of a cluster.  Unlike a MetricTable, every
+# aggregate of a metric is used, so each name maps to a list of
+# AggregateRule.
+class AggregateTable(MetricTable):
+    def candidates(self, metric_name):
+        try:
+            return self.services[metric_name]
+        except KeyError:
+            pass
+        found = []
+        for aggregate_list, match in self.lookup(metric_name):
+            for aggregate in aggregate_list:
+                service_name = aggregate.service_name
+                if match is not None:
+                    service_name = match.expand(service_name)
+                found.append((aggregate, service_name))
+        found = tuple(found)
+        self.services[metric_name] = found
+        return found
+
+
+# Builds the cluster -> AggregateTable tables from ConfigParser.aggregates,
+# a list of (cluster_name, metric_name, AggregateRule)
+def compile_aggregates(aggregates):
+    cluster_names = []
+    metrics = {}
+    for cluster_name, metric_name, aggregate in aggregates:
+        if cluster_name not in metrics:
+            cluster_names.append(cluster_name)
+            metrics[cluster_name] = []
+        for name, aggregate_list in metrics[cluster_name]:
+            if name == metric_name:
+                aggregate_list.append(aggregate)
+                break
+        else:
+            metrics[cluster_name].append((metric_name, [aggregate]))
+    aggregate_table = NameTable(False)
+    for cluster_name in cluster_names:
+        metric_table = AggregateTable()
+        for metric_name, aggregate_list in metrics[cluster_name]:
+            metric_table.add(metric_name, aggregate_list)
+        aggregate_table.add(cluster_name, metric_table)
+    return aggregate_table
+
+
+# the metrics to be reported for one host found in the XML
+class HostMatch:
+    def __init__(self, metric_tables, nagios_services):
+        self.metric_tables = metric_tables
+        self.nagios_services = nagios_services
+        # metrics that are configured but whose service Nagios lacks
+        self.unknown = 0
+
+    # returns (ThresholdRule, service_name) for the first definition of
+    # metric_name whose service is known to Nagios, or None
+    def metric(self, metric_name):
+        configured = False
+        for metric_table in self.metric_tables:
+            for metric_def, service_name in metric_table.candidates(metric_name):
+                if service_name in self.nagios_services:
+                    return (metric_def, service_name)
+                configured = True
+        if configured:
+            self.unknown += 1
+        return None
+
+
+# Lookup index built once from the configured clusters and aggregates,
+# or the tables already compiled by compile_clusters() and
+# compile_aggregates(), and the NagiosInventory of hosts and services
+# known to Nagios
+class MatchIndex:
+    def __init__(self, clusters, nagios_inventory, aggregates=()):
+        if not isinstance(clusters, NameTable):
+            clusters = compile_clusters(clusters)
+        if not isinstance(aggregates, NameTable):
+            aggregates = compile_aggregates(aggregates)
+        self.clusters = clusters
+        self.aggregates = aggregates
+        self.nagios_inventory = nagios_inventory
+
+    # returns the host tables of every cluster definition matching
+    # cluster_name, an empty tuple if the cluster is not monitored
+    def cluster(self, cluster_name):
+        return tuple([host_table for host_table, match in self.clusters.lookup(cluster_name)])
+
+    # returns the AggregateTables of cluster_name
+    def cluster_aggregates(self, cluster_name):
+        return tuple([metric_table for metric_table, match in self.aggregates.lookup(cluster_name)])
+
+    # returns a HostMatch for host_name or None if the host is not
+    # configured in any of the host tables or not known to Nagios
+    def host(self, host_tables, host_name):
+        nagios_services = self.nagios_inventory.services(host_name)
+        if nagios_services is None:
+            return None
+        metric_tables = []
+        for host_table in host_tables:
+            for metric_table, match in host_table.lookup(host_name):
+                metric_tables.append(metric_table)
+        if not metric_tables:
+            return None
+        return HostMatch(metric_tables, nagios_services)
@@ -23,70 +23,146 @@ import tempfile
 import sys
 
 
+# record layouts, rendered with a single string format per check result
+HOST_TEMPLATE = ("\n### Nagios Host Check Result ###\n"
+                 "# Time: %s\n"
+                 "host_name=%s\n"
+                 "check_type=%s\n"
+                 "check_options=%s\n"
+                 "scheduled_check=%s\n"
+                 "reschedule_check=%s\n"
+                 "latency=%s\n"
+                 "start_time=%s\n"
+                 "finish_time=%s\n"
+                 "early_timeout=%s\n"
+                 "exited_ok=%s\n"
+                 "return_code=%s\n"
+                 "output= %s\\n\n")
+
+SERVICE_TEMPLATE = ("\n### Nagios Service Check Result ###\n"
+                    "# Time: %s\n"
+                    "host_name=%s\n"
+                    "service_description=%s\n"
+                    "check_type=%s\n"
+                    "check_options=%s\n"
+                    "scheduled_check=%s\n"
+                    "reschedule_check=%s\n"
+                    "latency=%s\n"
+                    "start_time=%s\n"
+                    "finish_time=%s\n"
+                    "early_timeout=%s\n"
+                    "exited_ok=%s\n"
+                    "return_code=%s\n"
+                    "output=%s\\n\n")
+
+# bytes collected in memory before they are written to the file
+BUFFER_SIZE = 256 * 1024
+
+
 class GenerateNagiosCheckResult:
-    
-    def __init__(self):
-	self.service_state = {0: 'OK', 1: 'WARNING', 2: 'CRITICAL', 3: 'UNKNOWN'}
-	self.host_state = {0: 'UP', 1: 'DOWN', 2: 'DOWN', 3: 'DOWN'}
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.service_state = {0: 'OK', 1: 'WARNING', 2: 'CRITICAL', 3: 'UNKNOWN'}
+        self.host_state = {0: 'UP', 1: 'DOWN', 2: 'DOWN', 3: 'DOWN'}
+        self.buffer_size = buffer_size
+        self.cmd_files = []
+        self.fh = None
 
     # Creates a checkresult file
-    def create(self, nagios_result_dir, file_time):
-	# Nagios is quite fussy about the filename, it must be
+    # If max_records > 0, the results are split over several files
+    # of at most max_records check results each, every full file is
+    # handed over to Nagios as soon as it is complete
+    # If defer_ok is set, no file is handed over, the caller writes the
+    # ok-to-go indicators of cmd_files with write_ok_files()
+    def create(self, nagios_result_dir, file_time, max_records=0, defer_ok=False):
+        self.nagios_result_dir = nagios_result_dir
+        self.file_time = file_time
+        self.max_records = max_records
+        self.defer_ok = defer_ok
+        self.open_file()
+
+    def open_file(self):
+        # Nagios is quite fussy about the filename, it must be
         # a 7 character name starting with 'c'
-	tmp_file = tempfile.mkstemp(prefix='c',dir=nagios_result_dir) # specifies name and directory, check tempfile thoroughly
-	self.fh = tmp_file[0]
+        tmp_file = tempfile.mkstemp(prefix='c',dir=self.nagios_result_dir) # specifies name and directory, check tempfile thoroughly
+        self.fh = tmp_file[0]
         self.cmd_file = tmp_file[1]
-        os.write(self.fh, "### Active Check Result File ###\n")
-        os.write(self.fh, "file_time=" + str(file_time) + "\n")
-        
+        self.cmd_files.append(self.cmd_file)
+        self.records = 0
+        self.buf = ["### Active Check Result File ###\nfile_time=" + str(self.file_time) + "\n"]
+        self.buf_len = len(self.buf[0])
+
+    def append(self, record):
+        if self.max_records > 0 and self.records >= self.max_records:
+            self.close_file()
+            self.open_file()
+        self.buf.append(record)
+        self.buf_len += len(record)
+        self.records += 1
+        if self.buf_len >= self.buffer_size:
+            self.flush()
+
+    # write everything buffered so far to the file
+    def flush(self):
+        data = "".join(self.buf)
+        while data:
+            written = os.write(self.fh, data)
+            data = data[written:]
+        self.buf = []
+        self.buf_len = 0
+
+    # Close the file handle and create an ok-to-go indicator file
+    def close_file(self):
+        self.flush()
+        os.close(self.fh)
+        self.fh = None
+        if not self.defer_ok:
+            write_ok_files([self.cmd_file])
+
+    # Closes the file and removes every file written, for results that
+    # must not reach Nagios
+    def discard(self):
+        if self.fh is not None:
+            os.close(self.fh)
+            self.fh = None
+        remove_files(self.cmd_files)
+        self.cmd_files = []
+
     # Accepts parameters required for the host checkresult
     # Writes host checks to checkresult file
     def build_host(self, checkresult_time, host, check_type, check_options, scheduled_check, reschedule_check, latency, start_time, finish_time, early_timeout, exited_ok, host_return_code, output_string):
-	os.write(self.fh, "\n### Nagios Host Check Result ###\n")
-        os.write(self.fh, "# Time: " + checkresult_time + "\n")
-        os.write(self.fh, "host_name=" + host + "\n")
-        os.write(self.fh, "check_type=" + str(check_type) + "\n")
-        os.write(self.fh, "check_options=" + str(check_options) + "\n")
-        os.write(self.fh, "scheduled_check=" + str(scheduled_check) + "\n")
-        os.write(self.fh, "reschedule_check=" + str(reschedule_check) + "\n")
-        os.write(self.fh, "latency=" + str(latency) + "\n")
-        os.write(self.fh, "start_time=" + str(start_time) + "\n")
-        os.write(self.fh, "finish_time=" + str(finish_time) + "\n")
-        os.write(self.fh, "early_timeout=" + str(early_timeout) + "\n")
-        os.write(self.fh, "exited_ok=" + str(exited_ok) + "\n")
-        os.write(self.fh, "return_code=" + str(host_return_code) + "\n")
-	if not output_string:
-            os.write(self.fh, "output=" + " " + "Host (" + host + ")" + " " + self.host_state[host_return_code] + "\\n\n")
-	else:
-            os.write(self.fh, "output=" + " " + output_string + "\\n\n")
-            
+        if not output_string:
+            output_string = "Host (" + host + ") " + self.host_state[host_return_code]
+        self.append(HOST_TEMPLATE % (checkresult_time, host, check_type, check_options, scheduled_check, reschedule_check, latency, start_time, finish_time, early_timeout, exited_ok, host_return_code, output_string))
+
     # Accepts parameters required for the service checkresult
-    # Writes service checks to the checkresult file 
+    # Writes service checks to the checkresult file
     def build_service(self, checkresult_time, host, service_name, check_type, check_options, scheduled_check, reschedule_check, latency, start_time, finish_time, early_timeout, exited_ok, service_return_code, metric_value, metric_units, output_string):
-	os.write(self.fh, "\n### Nagios Service Check Result ###\n")
-        os.write(self.fh, "# Time: " + checkresult_time + "\n")
-        os.write(self.fh, "host_name=" + host + "\n")
-        os.write(self.fh, "service_description=" + service_name + "\n")
-        os.write(self.fh, "check_type=" + str(check_type) + "\n")
-        os.write(self.fh, "check_options=" + str(check_options) + "\n")
-        os.write(self.fh, "scheduled_check=" + str(scheduled_check) + "\n")
-        os.write(self.fh, "reschedule_check=" + str(reschedule_check) + "\n")
-        os.write(self.fh, "latency=" + str(latency) + "\n")
-        os.write(self.fh, "start_time=" + str(start_time) + "\n")
-        os.write(self.fh, "finish_time=" + str(finish_time) + "\n")
-        os.write(self.fh, "early_timeout=" + str(early_timeout) + "\n")
-        os.write(self.fh, "exited_ok=" + str(exited_ok) + "\n")
-        os.write(self.fh, "return_code=" + str(service_return_code) + "\n")
-	if not output_string:
-            os.write(self.fh, "output=" + service_name + " " + self.service_state[service_return_code] + "- " + service_name + " " +  str(metric_value) + " " + metric_units + "\\n\n")
-	else:
-            os.write(self.fh, "output=" + " " + output_string + "\\n\n")
-
-    # Close the file handle and create an ok-to-go indicator file 
+        if not output_string:
+            output_string = service_name + " " + self.service_state[service_return_code] + "- " + service_name + " " +  str(metric_value) + " " + metric_units
+        else:
+            output_string = " " + output_string
+        self.append(SERVICE_TEMPLATE % (checkresult_time, host, service_name, check_type, check_options, scheduled_check, reschedule_check, latency, start_time, finish_time, early_timeout, exited_ok, service_return_code, output_string))
+
+    # Writes the remaining results and hands the last file over to Nagios
     def submit(self):
-        os.close(self.fh)
-        ok_filename = self.cmd_file + ".ok"
-        ok_fh = file(ok_filename, 'a')
+        self.close_file()
+        return self.cmd_file
+
+
+# creates the ok-to-go indicator of every checkresult file, Nagios
+# ignores a checkresult file until its indicator exists
+def write_ok_files(cmd_files):
+    for cmd_file in cmd_files:
+        ok_fh = file(cmd_file + ".ok", 'a')
         ok_fh.close()
-	return self.cmd_file
 
+
+# removes checkresult files that were not handed over to Nagios
+def remove_files(cmd_files):
+    for cmd_file in cmd_files:
+        for filename in (cmd_file, cmd_file + ".ok"):
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+#
+# nagios_inventory - the hosts and services known to Nagios, with an
+# on-disk cache that is only rebuilt when the Nagios configuration changes
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import marshal
+import os
+import tempfile
+
+CACHE_VERSION = 2
+
+
+# Set of (host_name, service_description) pairs known to Nagios.  Most
+# hosts get their services from a few templates, so every distinct set
+# of services and every service name is only kept once.
+class NagiosInventory:
+    def __init__(self):
+        self.hosts = {}
+        self.service_sets = {}
+        self.service_names = {}
+
+    def add(self, host_name, services):
+        service_names = self.service_names
+        services = frozenset([service_names.setdefault(name, name) for name in services])
+        self.hosts[host_name] = self.service_sets.setdefault(services, services)
+
+    def has_host(self, host_name):
+        return host_name in self.hosts
+
+    # returns the set of services defined for host_name, or None if
+    # Nagios does not know the host
+    def services(self, host_name):
+        return self.hosts.get(host_name)
+
+    def __contains__(self, host_service):
+        services = self.hosts.get(host_service[0])
+        return services is not None and host_service[1] in services
+
+    def __len__(self):
+        return len(self.hosts)
+
+
+# Stores a NagiosInventory in cache_file together with the fingerprint
+# of the Nagios configuration files it was read from, as returned by
+# poll_scheduler.fingerprint
+class InventoryCache:
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+
+    # returns the cached inventory, or None if there is no cache or the
+    # Nagios configuration changed since it was written
+    def load(self, config_fingerprint):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return None
+        if data['fingerprint'] != [tuple(f) for f in config_fingerprint]:
+            return None
+        inventory = NagiosInventory()
+        service_sets = data['service_sets']
+        for host_name, i in data['hosts'].iteritems():
+            inventory.add(host_name, service_sets[i])
+        return inventory
+
+    # writes the cache atomically, so a concurrent reader never sees a
+    # partial file.  Each distinct set of services is written once and
+    # the hosts refer to it by its position.
+    def save(self, inventory, config_fingerprint):
+        service_sets = []
+        ids = {}
+        hosts = {}
+        for host_name, services in inventory.hosts.iteritems():
+            i = ids.get(services)
+            if i is None:
+                i = ids[services] = len(service_sets)
+                service_sets.append(tuple(services))
+            hosts[host_name] = i
+        data = {'version': CACHE_VERSION,
+                'fingerprint': [tuple(f) for f in config_fingerprint],
+                'service_sets': service_sets,
+                'hosts': hosts}
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp_name = tempfile.mkstemp(prefix='.inventory', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(data, f)
+            os.rename(tmp_name, self.cache_file)
+        except:
+            os.unlink(tmp_name)
+            raise
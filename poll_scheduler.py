@@ -0,0 +1,89 @@
+#!/usr/bin/python
+#
+# poll_scheduler - runs the bridge periodically when it is started as a
+# long running daemon instead of from cron
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import logging
+import os
+import time
+
+
+# Calls a function every interval seconds.  Each run is scheduled
+# relative to the first one, so the time taken by a cycle does not
+# make the schedule drift.  If a cycle overruns the interval, the
+# missed runs are skipped rather than started back to back.
+class PollScheduler:
+    def __init__(self, interval, clock=time.time, sleep=time.sleep):
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.running = False
+        self.overruns = 0
+
+    def stop(self):
+        self.running = False
+
+    def run(self, cycle):
+        self.running = True
+        next_run = self.clock()
+        while self.running:
+            cycle()
+            next_run += self.interval
+            now = self.clock()
+            if now > next_run:
+                missed = int((now - next_run) // self.interval) + 1
+                self.overruns += 1
+                logging.warn('Poll cycle overran the %s second interval, skipping %d run(s)', self.interval, missed)
+                next_run += missed * self.interval
+            # sleep() may return early when a signal arrives
+            while self.running:
+                remaining = next_run - self.clock()
+                if remaining <= 0:
+                    break
+                self.sleep(remaining)
+
+
+# returns the (path, mtime, size) of every file, sorted by path, used to
+# detect changes to the files
+def fingerprint(paths):
+    result = []
+    for path in sorted(paths):
+        try:
+            st = os.stat(path)
+            result.append((path, st.st_mtime, st.st_size))
+        except OSError:
+            result.append((path, None, None))
+    return result
+
+
+# Detects changes to a set of files by their modification time and size
+class FileWatcher:
+    def __init__(self, paths):
+        self.paths = paths
+        self.fingerprint = self.scan()
+
+    def scan(self):
+        return fingerprint(self.paths)
+
+    # returns True if any of the files changed since the last call
+    def changed(self):
+        fingerprint = self.scan()
+        if fingerprint == self.fingerprint:
+            return False
+        self.fingerprint = fingerprint
+        return True
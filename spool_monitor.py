@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#
+# spool_monitor - measures the backlog of checkresult files waiting for
+# Nagios and coalesces the files of the bridge when Nagios falls behind
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import os
+import re
+import tempfile
+import time
+import nagios_checkresult
+
+# the names given to checkresult files by GenerateNagiosCheckResult
+CHECKRESULT_NAME = re.compile(r'c[A-Za-z0-9_]{6}\Z')
+RECORD_START = '\n### Nagios '
+
+
+# returns the check results in the checkresult file data, without the
+# file header, as strings in the format written by
+# GenerateNagiosCheckResult
+def split_records(data):
+    return [RECORD_START + record for record in data.split(RECORD_START)[1:]]
+
+
+# the (host_name, service_description) a check result is for, the
+# service is '' for a host check
+def record_key(record):
+    host_name = ''
+    service_name = ''
+    for line in record.split('\n'):
+        if line.startswith('host_name='):
+            host_name = line[10:]
+        elif line.startswith('service_description='):
+            service_name = line[20:]
+            break
+        elif line.startswith('check_type='):
+            break
+    return (host_name, service_name)
+
+
+# Measures the checkresult files in nagios_result_dir that Nagios has
+# not read yet.  If there are more than max_backlog of them or the
+# oldest is older than max_age seconds, Nagios is falling behind: the
+# bridge then coalesces its results and polls less often, up to
+# max_backoff times the poll interval.  The files written by the bridge
+# are listed in ledger_file, so files written by other programs are
+# never touched.  The ledger keeps, for every file, when the oldest
+# result merged into it was first handed over and how many files it
+# replaces, so coalescing is not mistaken for Nagios catching up: the
+# backlog only shrinks once Nagios has read the files.
+class SpoolMonitor:
+    def __init__(self, nagios_result_dir, ledger_file=None, max_backlog=0, max_age=0, max_backoff=1):
+        self.nagios_result_dir = nagios_result_dir
+        self.ledger_file = ledger_file
+        self.max_backlog = max_backlog
+        self.max_age = max_age
+        self.max_backoff = max_backoff
+        self.backlog = 0
+        self.backlog_age = 0.0
+        self.pressure = False
+        # the poll interval is multiplied by this
+        self.backoff = 1
+
+    # returns the paths of the checkresult files waiting for Nagios
+    def pending(self):
+        names = set(os.listdir(self.nagios_result_dir))
+        return [os.path.join(self.nagios_result_dir, name) for name in names
+                if CHECKRESULT_NAME.match(name) and name + '.ok' in names]
+
+    # measures the backlog before a poll and decides whether Nagios is
+    # under pressure
+    def measure(self, now=None):
+        if now is None:
+            now = time.time()
+        ledger = {}
+        for cmd_file, handed_over, files in self.entries():
+            ledger[cmd_file] = (handed_over, files)
+        oldest = None
+        backlog = 0
+        for cmd_file in self.pending():
+            try:
+                handed_over = os.stat(cmd_file).st_mtime
+            except OSError:
+                # read by Nagios in the meantime
+                continue
+            files = 1
+            if cmd_file in ledger:
+                handed_over, files = ledger[cmd_file]
+            backlog += files
+            if oldest is None or handed_over < oldest:
+                oldest = handed_over
+        self.backlog = backlog
+        self.backlog_age = 0.0
+        if oldest is not None:
+            self.backlog_age = max(now - oldest, 0.0)
+        self.pressure = ((self.max_backlog > 0 and backlog > self.max_backlog) or
+                         (self.max_age > 0 and self.backlog_age > self.max_age))
+        if self.pressure:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        else:
+            self.backoff = 1
+        return self.pressure
+
+    # the ledger entries of the files of the bridge that Nagios has not
+    # read yet, oldest first, as (cmd_file, handed_over, files)
+    def entries(self):
+        if self.ledger_file is None:
+            return []
+        entries = []
+        try:
+            with open(self.ledger_file) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 3 and os.path.exists(fields[0]):
+                        entries.append((fields[0], float(fields[1]), int(fields[2])))
+        except (IOError, ValueError):
+            return []
+        return entries
+
+    # the files of the bridge that Nagios has not read yet, oldest first
+    def owned(self):
+        return [cmd_file for cmd_file, handed_over, files in self.entries()]
+
+    # records the files handed over to Nagios in the ledger, forgetting
+    # the files Nagios has read
+    def record(self, cmd_files, handed_over=None):
+        if handed_over is None:
+            handed_over = time.time()
+        self.write_ledger(self.entries() + [(cmd_file, handed_over, 1) for cmd_file in cmd_files])
+
+    def write_ledger(self, entries):
+        if self.ledger_file is None:
+            return
+        ledger_dir = os.path.dirname(os.path.abspath(self.ledger_file))
+        fd, tmp_name = tempfile.mkstemp(prefix='.ledger', dir=ledger_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(''.join(['%s %.3f %d\n' % entry for entry in entries]))
+            os.rename(tmp_name, self.ledger_file)
+        except:
+            os.unlink(tmp_name)
+            raise
+
+    # Takes a file of the bridge back from Nagios and returns its
+    # contents, or None if Nagios has read it already.  The ok-to-go
+    # indicator is removed first so Nagios does not start reading it.
+    def claim(self, cmd_file):
+        try:
+            os.unlink(cmd_file + '.ok')
+        except OSError:
+            return None
+        try:
+            with open(cmd_file) as f:
+                data = f.read()
+            os.unlink(cmd_file)
+        except (IOError, OSError):
+            return None
+        return data
+
+    # Merges the unread files of the bridge with new_files, the files of
+    # this poll which have not been handed over yet, keeping the newest
+    # result for every host and service.  The merged files are recorded
+    # in the ledger as handed over when the oldest result merged into
+    # them was.  Returns the files handed over to Nagios and the number
+    # of results dropped.
+    def coalesce(self, new_files, file_time, max_records=0):
+        newest = {}
+        order = []
+        total = 0
+        handed_over = time.time()
+        merged_files = len(new_files)
+        kept = []
+        sources = []
+        for entry in self.entries():
+            data = self.claim(entry[0])
+            if data is None:
+                # being read by Nagios
+                kept.append(entry)
+                continue
+            sources.append(data)
+            handed_over = min(handed_over, entry[1])
+            merged_files += entry[2]
+        for cmd_file in new_files:
+            with open(cmd_file) as f:
+                sources.append(f.read())
+        for data in sources:
+            for record in split_records(data):
+                key = record_key(record)
+                if key not in newest:
+                    order.append(key)
+                newest[key] = record
+                total += 1
+        gn = nagios_checkresult.GenerateNagiosCheckResult()
+        gn.create(self.nagios_result_dir, file_time, max_records)
+        for key in order:
+            gn.append(newest[key])
+        gn.submit()
+        nagios_checkresult.remove_files(new_files)
+        # the first file stands for all the files merged
+        entries = [(cmd_file, handed_over, 1) for cmd_file in gn.cmd_files]
+        entries[0] = (entries[0][0], handed_over, max(merged_files - len(entries) + 1, 1))
+        self.write_ledger(kept + entries)
+        return gn.cmd_files, total - len(order)
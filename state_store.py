@@ -0,0 +1,147 @@
+#!/usr/bin/python
+#
+# state_store - remembers the last return code written for every host
+# and service so that unchanged results can be suppressed
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import hashlib
+import mmap
+import os
+import struct
+
+# The store is a memory mapped hash table with open addressing.
+# header: magic, number of slots (a power of 2), number of used slots
+# slot: 64 bit hash of the names (0 marks a free slot), time the result
+# was last written, return code
+HEADER = struct.Struct('<4sII')
+SLOT = struct.Struct('<QIB3x')
+MAGIC = 'GNB1'
+INITIAL_SLOTS = 1024
+
+
+# 64 bit hash of a host/service pair, service_name is '' for host checks
+def state_key(host_name, service_name):
+    key = struct.unpack('<Q', hashlib.md5(host_name + '\0' + service_name).digest()[:8])[0]
+    return key or 1
+
+
+class LastStateStore:
+    def __init__(self, path, refresh_interval):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.map = None
+        # results to be written, by key: (time, return code).  They only
+        # reach the table with commit(), once Nagios has the results.
+        self.pending = {}
+        self.open()
+
+    def open(self):
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except OSError:
+            self.create(self.path, INITIAL_SLOTS)
+            fd = os.open(self.path, os.O_RDWR)
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER.size:
+                raise ValueError('state file %s is truncated' % self.path)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, self.slots, self.used = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or size != HEADER.size + self.slots * SLOT.size:
+            self.map.close()
+            self.map = None
+            raise ValueError('%s is not a state file' % self.path)
+
+    # writes an empty table, replacing any existing file
+    def create(self, path, slots):
+        tmp_name = path + '.tmp'
+        f = open(tmp_name, 'wb')
+        try:
+            f.write(HEADER.pack(MAGIC, slots, 0))
+            f.truncate(HEADER.size + slots * SLOT.size)
+        finally:
+            f.close()
+        os.rename(tmp_name, path)
+
+    # returns the offset of the slot for key, either the slot holding
+    # it or the free slot where it should be inserted
+    def find(self, key):
+        mask = self.slots - 1
+        idx = key & mask
+        while True:
+            offset = HEADER.size + idx * SLOT.size
+            slot_key = SLOT.unpack_from(self.map, offset)[0]
+            if slot_key == key or slot_key == 0:
+                return offset
+            idx = (idx + 1) & mask
+
+    # doubles the table once it is 70% full
+    def grow(self):
+        entries = []
+        for idx in xrange(self.slots):
+            entry = SLOT.unpack_from(self.map, HEADER.size + idx * SLOT.size)
+            if entry[0] != 0:
+                entries.append(entry)
+        self.map.close()
+        self.create(self.path, self.slots * 2)
+        self.open()
+        for entry in entries:
+            SLOT.pack_into(self.map, self.find(entry[0]), *entry)
+        self.used = len(entries)
+        HEADER.pack_into(self.map, 0, MAGIC, self.slots, self.used)
+
+    # returns True if the result should be written: the return code
+    # changed, the pair was never seen or the last result written is
+    # older than refresh_interval.  The result is kept pending until
+    # commit().
+    def should_emit(self, host_name, service_name, return_code, now):
+        key = state_key(host_name, service_name)
+        if key in self.pending:
+            emitted, last_code = self.pending[key]
+        else:
+            slot_key, emitted, last_code = SLOT.unpack_from(self.map, self.find(key))
+            if slot_key != key:
+                last_code = None
+        if last_code == return_code and now - emitted < self.refresh_interval:
+            return False
+        self.pending[key] = (now, return_code)
+        return True
+
+    # writes the pending results to the table, once they were handed
+    # over to Nagios
+    def commit(self):
+        for key, (emitted, return_code) in self.pending.iteritems():
+            offset = self.find(key)
+            slot_key = SLOT.unpack_from(self.map, offset)[0]
+            SLOT.pack_into(self.map, offset, key, emitted, return_code)
+            if slot_key == 0:
+                self.used += 1
+                HEADER.pack_into(self.map, 0, MAGIC, self.slots, self.used)
+                if self.used * 10 > self.slots * 7:
+                    self.grow()
+        self.pending = {}
+
+    # pending results that were not committed are dropped, Nagios never
+    # received them
+    def close(self):
+        self.pending = {}
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+#
+# subtree_filter - removes the CLUSTER and HOST elements that are not
+# monitored from the Ganglia XML before it reaches the XML parser
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import re
+from xml.sax.saxutils import unescape
+
+READ_SIZE = 64 * 1024
+
+# the start of a CLUSTER or HOST tag
+START_TAG = re.compile(r'<(CLUSTER|HOST)\s')
+# the rest of the tag, attribute values may contain '>'
+TAG_END = re.compile(r'(?:[^>"]|"[^"]*")*?(/?)>')
+NAME_ATTRIBUTE = re.compile(r'\sNAME="([^"]*)"')
+END_TAGS = {'CLUSTER': '</CLUSTER>', 'HOST': '</HOST>'}
+# the longest START_TAG match, a shorter tail of the buffer may be the
+# start of a tag that continues in the next read
+START_TAG_LENGTH = len('<CLUSTER ')
+ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+
+# Wraps an XML document, returning it without the CLUSTER and HOST
+# elements that the MatchIndex does not monitor.  The bytes of a skipped
+# element are only searched for its end tag, so the parser never builds
+# attributes or calls the handler for anything inside it.  Ganglia
+# writes each tag on one line but a tag may still be split between two
+# reads, so an incomplete tag is kept until the next read.
+class SubtreeFilter:
+    def __init__(self, source, match_index, strip_domains):
+        self.source = source
+        self.match_index = match_index
+        self.strip_domains = strip_domains
+        self.host_tables = ()
+        # every host of a cluster with aggregates is kept
+        self.aggregated = False
+        self.buffer = ''
+        self.output = []
+        self.output_size = 0
+        # end tag of the element being skipped, None while copying
+        self.skip_end = None
+        self.eof = False
+        # number of CLUSTER and HOST elements removed
+        self.skipped = 0
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or self.output_size < size):
+            data = self.source.read(READ_SIZE)
+            if data:
+                self.scan(self.buffer + data)
+            else:
+                self.eof = True
+                if self.skip_end is None:
+                    self.emit(self.buffer)
+                self.buffer = ''
+        data = ''.join(self.output)
+        if size >= 0 and len(data) > size:
+            self.output = [data[size:]]
+            self.output_size = len(data) - size
+            return data[:size]
+        self.output = []
+        self.output_size = 0
+        return data
+
+    def close(self):
+        self.source.close()
+
+    def emit(self, data):
+        if data:
+            self.output.append(data)
+            self.output_size += len(data)
+
+    # copies buf to the output up to the end of the last complete tag,
+    # dropping unmonitored elements, and keeps the rest for the next read
+    def scan(self, buf):
+        pos = 0
+        while True:
+            if self.skip_end is not None:
+                end = buf.find(self.skip_end, pos)
+                if end < 0:
+                    # the end tag may start in the last few bytes
+                    pos = max(pos, len(buf) - len(self.skip_end) + 1)
+                    break
+                pos = end + len(self.skip_end)
+                self.skip_end = None
+                continue
+            match = START_TAG.search(buf, pos)
+            if match is None:
+                keep = max(pos, len(buf) - START_TAG_LENGTH + 1)
+                self.emit(buf[pos:keep])
+                pos = keep
+                break
+            start = match.start()
+            tag_end = TAG_END.match(buf, match.end())
+            if tag_end is None:
+                self.emit(buf[pos:start])
+                pos = start
+                break
+            element = match.group(1)
+            tag = buf[start:tag_end.end()]
+            if self.monitored(element, tag):
+                self.emit(buf[pos:tag_end.end()])
+            else:
+                self.emit(buf[pos:start])
+                self.skipped += 1
+                if not tag_end.group(1):
+                    self.skip_end = END_TAGS[element]
+            pos = tag_end.end()
+        self.buffer = buf[pos:]
+
+    # decides whether the CLUSTER or HOST starting with tag is monitored
+    def monitored(self, element, tag):
+        name = NAME_ATTRIBUTE.search(tag)
+        if name is None:
+            return True
+        # Ganglia declares the XML as ISO-8859-1
+        name = unescape(name.group(1), ENTITIES).decode('iso-8859-1')
+        if element == 'CLUSTER':
+            self.host_tables = self.match_index.cluster(name)
+            self.aggregated = len(self.match_index.cluster_aggregates(name)) > 0
+            return len(self.host_tables) > 0 or self.aggregated
+        if self.aggregated:
+            return True
+        if self.strip_domains:
+            name = name.partition('.')[0]
+        return self.match_index.host(self.host_tables, name) is not None
@@ -0,0 +1,107 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import os
+import random
+import shutil
+import tempfile
+from cStringIO import StringIO
+import aggregates
+import benchmark
+import conf_parser
+from fake_io import RecordingWriter
+import match_index
+import nagios_inventory
+import subtree_filter
+import xml_engines
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+class TestHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        random.seed(2)
+        values = [random.lognormvariate(0, 2) for i in range(5000)] + [0.0] * 100 + [-random.uniform(0, 10) for i in range(200)]
+        histogram = aggregates.Histogram()
+        for value in values:
+            histogram.add(value)
+        values.sort()
+        for q in [0.01, 0.25, 0.5, 0.95, 0.99]:
+            exact = values[int(q * (len(values) - 1))]
+            self.assertTrue(abs(histogram.quantile(q) - exact) <= abs(exact) * 0.02, (q, histogram.quantile(q), exact))
+        self.assertEqual(histogram.quantile(0), values[0])
+        self.assertEqual(histogram.quantile(1), values[-1])
+        self.assertTrue(len(histogram.positive) + len(histogram.negative) < 2000)
+        self.assertEqual(aggregates.Histogram().quantile(0.5), None)
+
+class TestAggregates(unittest.TestCase):
+    def setUp (self):
+        self.xml_data = benchmark.generate_grid(3, 20, 4)
+        # metric_000 of the 20 hosts of cluster000
+        self.values = sorted([((0 * 7 + h * 13 + 0 * 17) % 10000) / 100.0 for h in range(20)])
+        rule = conf_parser.AggregateRule
+        self.aggregates = [('cluster000', 'metric_000', rule('Max', None, 'max', warn_above='1', crit_above='2')),
+                           ('cluster000', 'metric_000', rule('P95', None, 'p95')),
+                           ('cluster000', 'metric_000', rule('Mean', 'grid', 'mean', warn_below='10')),
+                           ('cluster00[01]', r'metric_00(\d)', rule(r'Above \1', None, 'count_above', count_above='1')),
+                           ('cluster000', 'metric_003', rule('Strings', None, 'max')),
+                           ('cluster002', 'metric_000', rule('Not in Nagios', None, 'max'))]
+        self.inventory = nagios_inventory.NagiosInventory()
+        self.inventory.add('cluster000', ['Max', 'P95', 'Above 0', 'Above 1', 'Above 2', 'Strings'])
+        self.inventory.add('cluster001', ['Above 0'])
+        self.inventory.add('grid', ['Mean'])
+        self.index = match_index.MatchIndex([], self.inventory, self.aggregates)
+
+    def parse(self, document):
+        writer = RecordingWriter()
+        handler = bridge.GangliaHandler(self.index, bridge.PassiveGenerator(0, 60), writer, True)
+        xml_engines.parse_expat(document, handler)
+        return writer.service_results(), handler
+
+    def test_cluster_services(self):
+        services, handler = self.parse(StringIO(self.xml_data))
+        self.assertEqual(services[('cluster000', 'Max')][:2], (2, self.values[-1]))
+        self.assertEqual(services[('grid', 'Mean')][:2], (1, sum(self.values) / 20))
+        p95 = services[('cluster000', 'P95')][1]
+        self.assertTrue(abs(p95 - self.values[int(0.95 * 19)]) <= self.values[int(0.95 * 19)] * 0.01)
+        self.assertEqual(services[('cluster000', 'Above 0')][1], len([v for v in self.values if v > 1]))
+        self.assertTrue(('cluster000', 'Above 2') in services)
+        self.assertTrue(('cluster001', 'Above 0') in services)
+        # metric_003 is a string metric
+        self.assertEqual(services[('cluster000', 'Strings')][0], 3)
+        self.assertTrue('no values reported' in services[('cluster000', 'Strings')][2])
+        self.assertTrue(services[('cluster000', 'Max')][2].startswith('Max CRITICAL - max %g%% over 20 hosts|max=' % self.values[-1]))
+        self.assertEqual(len(services), 8)
+        # Above 3 of cluster000, Above 1, 2 and 3 of cluster001, Not in Nagios
+        self.assertEqual(handler.metrics_unknown, 5)
+
+    def test_subtree_filter_keeps_hosts(self):
+        expected, handler = self.parse(StringIO(self.xml_data))
+        document = subtree_filter.SubtreeFilter(StringIO(self.xml_data), self.index, True)
+        services, handler = self.parse(document)
+        self.assertEqual(services, expected)
+        self.assertEqual(document.skipped, 0)
+        self.index = match_index.MatchIndex([], self.inventory, self.aggregates[:1])
+        document = subtree_filter.SubtreeFilter(StringIO(self.xml_data), self.index, True)
+        self.parse(document)
+        self.assertEqual(document.skipped, 2)
+
+    def test_config(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_file = os.path.join(tmp_dir, 'bridge.conf')
+            text = open('ganglia-nagios-bridge.conf').read()
+            open(config_file, 'w').write(text + '[aggregates]\n[[Load p95]]\ncluster = web\nmetric = load_one\nstatistic = p95\nwarn_above = 4\n')
+            config = conf_parser.ConfigParser()
+            self.assertTrue(config.parse(config_file))
+            cluster_name, metric_name, aggregate = config.aggregates[0]
+            self.assertEqual((cluster_name, metric_name, aggregate.service_name, aggregate.quantile, aggregate.warn_above),
+                             ('web', 'load_one', 'Load p95', 0.95, 4.0))
+            self.assertFalse('aggregates' in [c[0] for c in config.clusters])
+            open(config_file, 'w').write(text + '[aggregates]\n[[Load]]\ncluster = web\nmetric = load_one\nstatistic = median\n')
+            self.assertFalse(conf_parser.ConfigParser().parse(config_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
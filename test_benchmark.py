@@ -0,0 +1,27 @@
+#! /usr/bin/python
+
+import unittest
+import argparse
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def test_small_grid(self):
+        args = argparse.Namespace(clusters=3, hosts=4, metrics=8, monitored_clusters=2, monitored_metrics=4,
+                                  skip_unmonitored=True, engine='expat')
+        results = benchmark.run(args)
+        self.assertEqual(sorted(results['phases'].keys()), sorted(benchmark.PHASES))
+        # 3 clusters, 4 hosts, 8 metrics with 3 EXTRA_* elements each
+        self.assertEqual(results['elements'], 2 + 3 + 3 * 4 + 3 * 4 * 8 * 5)
+        # a host check and 4 services for every host in 2 clusters
+        self.assertEqual(results['results'], 2 * 4 * 5)
+        self.assertTrue(results['peak_rss'] > 0)
+
+    def test_memory(self):
+        args = argparse.Namespace(clusters=2, hosts=5, metrics=4, monitored_clusters=2, monitored_metrics=2,
+                                  skip_unmonitored=True, engine='expat')
+        results = benchmark.run_memory(args, 2)
+        self.assertEqual([r['hosts'] for r in results], [10, 20])
+        self.assertTrue(results[1]['peak_rss'] > 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#! /usr/bin/python
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+import bridge_stats
+import nagios_checkresult
+
+class TestBridgeStats(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stats = bridge_stats.BridgeStats()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_counters_and_phases(self):
+        with self.stats.phase('parse'):
+            time.sleep(0.01)
+        self.stats.add_time('parse', 1.0)
+        self.stats.count('results_written', 3)
+        self.stats.count('results_written')
+        self.assertTrue(self.stats.phases['parse'] >= 1.01)
+        self.assertEqual(self.stats.counters['results_written'], 4)
+        reader = bridge_stats.CountingReader(open(__file__), self.stats)
+        data = reader.read()
+        self.assertEqual(self.stats.counters['bytes_received'], len(data))
+
+    def test_write_json(self):
+        path = os.path.join(self.tmp_dir, 'stats.json')
+        self.stats.count('elements', 42)
+        self.stats.write_json(path)
+        data = json.load(open(path))
+        self.assertEqual(data['counters']['elements'], 42)
+        self.assertEqual(sorted(data['phases'].keys()), sorted(bridge_stats.PHASES))
+        self.assertEqual(os.listdir(self.tmp_dir), ['stats.json'])
+
+    def test_emit_check(self):
+        gn = nagios_checkresult.GenerateNagiosCheckResult()
+        gn.create(self.tmp_dir, 1400347643)
+        self.stats.count('results_written', 7)
+        self.assertEqual(self.stats.emit_check(gn, 'nagios', 'Ganglia Nagios Bridge', 30, 60), 0)
+        self.stats.started -= 45
+        self.assertEqual(self.stats.emit_check(gn, 'nagios', 'Ganglia Nagios Bridge', 30, 60), 1)
+        content = open(gn.submit()).read()
+        self.assertTrue('service_description=Ganglia Nagios Bridge\n' in content)
+        self.assertTrue('output= Ganglia Nagios Bridge WARNING - poll took 45.' in content)
+        self.assertTrue(' results_written=7;;;0; ' in content)
+        self.assertTrue('|duration=45.' in content)
+
+if __name__ == '__main__':
+    unittest.main()
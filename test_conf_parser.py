@@ -0,0 +1,126 @@
+#! /usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import conf_parser
+import config_cache
+import match_index
+import nagios_inventory
+
+class TestConfParser(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.tmp_dir, 'bridge.conf')
+        self.cache_file = os.path.join(self.tmp_dir, 'config.cache')
+        shutil.copy('ganglia-nagios-bridge.conf', self.config_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_host_groups_share_rules(self):
+        config = conf_parser.ConfigParser()
+        self.assertTrue(config.parse(self.config_file))
+        cluster_name, cluster_hosts = config.clusters[0]
+        self.assertTrue(cluster_hosts['host_01'][0] is cluster_hosts['host_02'][0])
+        # DISK FREE has different thresholds in the two clusters
+        self.assertEqual(dict(cluster_hosts['host_02'][1])['disk_free'].warn_below, 5.0)
+        self.assertEqual(dict(config.clusters[1][1]['host3'][0])['disk_free'].warn_below, 10.0)
+        # the hosts of a group share one compiled metric table
+        host_table = config.cluster_table.lookup('Production1')[0][0]
+        self.assertTrue(host_table.exact['host3'] is host_table.exact['host12'])
+        self.assertFalse(host_table.exact['host3'] is host_table.exact['host1'])
+
+    def test_clusters_literal(self):
+        config = conf_parser.ConfigParser()
+        self.assertTrue(config.parse('nagios-bridge.conf'))
+        self.assertEqual(config.gmetad_sources, [('127.0.0.1', 8651)])
+        self.assertEqual([cluster_name for cluster_name, cluster_hosts in config.clusters], ['.*', 'SomeCluster'])
+        metrics = config.clusters[0][1]['.*'][0]
+        self.assertEqual([metric_name for metric_name, metric_def in metrics], ['proc_total', r'load_(\w+)'])
+        self.assertEqual(metrics[0][1].warn_above, 120.0)
+        inventory = nagios_inventory.NagiosInventory()
+        inventory.add('host_01', ['Total processes', 'Load avg five minute'])
+        index = match_index.MatchIndex(config.cluster_table, inventory)
+        host_match = index.host(index.cluster('any'), 'host_01')
+        self.assertEqual(host_match.metric('load_five')[1], 'Load avg five minute')
+        self.assertEqual(host_match.metric('proc_total')[1], 'Total processes')
+
+    def test_comment_in_literal_string(self):
+        open(self.config_file, 'w').write("""force_dmax = 0
+tmax_grace = 30
+strip_domains = True
+gmetad_host = localhost
+gmetad_port = 8651
+nagios_result_dir = /tmp
+clusters = [('web', [('www\\d+', [('disk_free', {'service_name': 'Disk # free', 'crit_below': 2})])])]  # trailing
+""")
+        config = conf_parser.ConfigParser()
+        self.assertTrue(config.parse(self.config_file))
+        self.assertEqual(config.clusters[0][1][r'www\d+'][0][0][1].service_name, 'Disk # free')
+        # identical definitions share one rule
+        open(self.config_file, 'a').write("[db]\n[[db1]]\n[[[disk_free]]]\nservice_name = \"Disk # free\"\ncrit_below = 2.0\n")
+        config = conf_parser.ConfigParser()
+        self.assertTrue(config.parse(self.config_file))
+        self.assertTrue(config.clusters[0][1][r'www\d+'][0][0][1] is config.clusters[1][1]['db1'][0][0][1])
+        open(self.config_file, 'w').write("nagios_result_dir = /tmp\nclusters = [('web', [\n")
+        self.assertFalse(conf_parser.ConfigParser().parse(self.config_file))
+
+    def test_invalid_pattern(self):
+        config_text = """force_dmax = 0
+tmax_grace = 30
+strip_domains = True
+gmetad_host = localhost
+gmetad_port = 8651
+nagios_result_dir = /tmp
+[%s]
+[[host1]]
+[[[load_one]]]
+service_name = Load
+crit_above = 5
+"""
+        open(self.config_file, 'w').write(config_text % 'Web (EU)')
+        config = conf_parser.ConfigParser()
+        self.assertTrue(config.parse(self.config_file))
+        self.assertEqual(len(config.cluster_table.lookup('Web (EU)')), 1)
+        open(self.config_file, 'w').write(config_text % 'C++ cluster')
+        self.assertFalse(conf_parser.ConfigParser().parse(self.config_file))
+
+    def test_cache(self):
+        cache = config_cache.ConfigCache(self.cache_file)
+        self.assertEqual(cache.load(self.config_file), None)
+        config = config_cache.load_config(self.config_file, self.cache_file)
+        cached = cache.load(self.config_file)
+        self.assertEqual(cached.clusters[0][0], config.clusters[0][0])
+        self.assertEqual(cached.nagios_result_dir, config.nagios_result_dir)
+        host_table = cached.cluster_table.lookup('cluster_name')[0][0]
+        self.assertEqual(host_table.lookup('host_02')[0][0].candidates('disk_free')[0][1], 'DISK FREE')
+        # touched but unchanged
+        os.utime(self.config_file, (time.time() + 10, time.time() + 10))
+        self.assertNotEqual(cache.load(self.config_file), None)
+        # changed
+        text = open(self.config_file).read()
+        open(self.config_file, 'w').write(text.replace('poll_interval = 60', 'poll_interval = 30'))
+        self.assertEqual(cache.load(self.config_file), None)
+        self.assertEqual(config_cache.load_config(self.config_file, self.cache_file).poll_interval, 30)
+        self.assertEqual(cache.load(self.config_file).poll_interval, 30)
+
+    def test_memo_not_cached(self):
+        config = config_cache.load_config(self.config_file, self.cache_file)
+        host_table = config.cluster_table.lookup('cluster_name')[0][0]
+        host_table.lookup('host_02')[0][0].candidates('disk_free')
+        cache = config_cache.ConfigCache(self.cache_file)
+        cache.save(config, self.config_file)
+        cached = cache.load(self.config_file)
+        self.assertEqual(cached.cluster_table.resolved, {})
+        self.assertEqual(cached.cluster_table.exact['cluster_name'].exact['host_02'].services, {})
+
+    def test_corrupt_cache(self):
+        open(self.cache_file, 'w').write('not a cache')
+        self.assertEqual(config_cache.ConfigCache(self.cache_file).load(self.config_file), None)
+        self.assertNotEqual(config_cache.load_config(self.config_file, self.cache_file), None)
+
+if __name__ == '__main__':
+    unittest.main()
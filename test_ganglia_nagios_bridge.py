@@ -0,0 +1,107 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import benchmark
+import fake_gmetad
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+CONFIG = """force_dmax = 0
+tmax_grace = 60
+strip_domains = True
+gmetad_host = 127.0.0.1
+gmetad_port = %d
+gmetad_timeout = %s
+nagios_result_dir = %s
+[cluster000]
+[[c000-h.*]]
+[[[metric_000]]]
+service_name = Synthetic metric 0
+warn_above = 80
+crit_above = 90
+"""
+
+# the Nagios inventory without pynag
+class StubHosts:
+    def __init__(self, inventory):
+        self.inventory = inventory
+
+    def changed(self):
+        return False
+
+class TestBridge(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.result_dir = os.path.join(self.tmp_dir, 'checkresults')
+        os.mkdir(self.result_dir)
+        self.xml_data = benchmark.generate_grid(1, 4, 2)
+        # delay before the second half of the XML is sent
+        self.stall = 0.0
+        self.gmetad = fake_gmetad.FakeGmetad(self.respond)
+        self.gmetad.start()
+        self.handlers = [(signum, signal.getsignal(signum)) for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)]
+
+    def tearDown(self):
+        for signum, handler in self.handlers:
+            signal.signal(signum, handler)
+        self.gmetad.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def respond(self, path):
+        half = len(self.xml_data) // 2
+        yield self.xml_data[:half]
+        time.sleep(self.stall)
+        yield self.xml_data[half:]
+
+    def bridge(self, gmetad_timeout):
+        config_file = os.path.join(self.tmp_dir, 'bridge.conf')
+        open(config_file, 'w').write(CONFIG % (self.gmetad.port, gmetad_timeout, self.result_dir))
+        b = bridge.Bridge(config_file)
+        b.nagios_hosts = StubHosts(benchmark.synthetic_inventory(1, 4, 1))
+        return b
+
+    # the checkresult files handed over to Nagios and their results
+    def results(self):
+        names = sorted(os.listdir(self.result_dir))
+        cmd_files = [os.path.join(self.result_dir, name) for name in names if not name.endswith('.ok')]
+        data = ''.join([open(cmd_file).read() for cmd_file in cmd_files])
+        return names, data.count('host_name=')
+
+    def test_reload_signal_during_poll(self):
+        self.stall = 0.5
+        b = self.bridge(5)
+        b.install_signal_handlers(lambda signum, frame: None)
+        timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGHUP))
+        timer.start()
+        b.run_cycle()
+        timer.join()
+        self.assertTrue(b.reload_requested)
+        names, results = self.results()
+        self.assertEqual(len(names), 2)
+        # a host check and a service for each of the 4 hosts
+        self.assertEqual(results, 8)
+
+    def test_stalled_gmetad(self):
+        self.stall = 1.0
+        b = self.bridge(0.3)
+        fds = len(os.listdir('/proc/self/fd'))
+        for i in range(3):
+            b.safe_cycle()
+        # the partial results of the failed polls are removed
+        self.assertEqual(os.listdir(self.result_dir), [])
+        # the fake gmetad closes its side once the stall is over
+        time.sleep(1.0)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+        self.stall = 0.0
+        b.safe_cycle()
+        self.assertEqual(self.results()[1], 8)
+
+if __name__ == '__main__':
+    unittest.main()
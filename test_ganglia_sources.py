@@ -0,0 +1,46 @@
+#! /usr/bin/python
+
+import unittest
+import socket
+import time
+import fake_gmetad
+import ganglia_sources
+import xml_spool
+
+class TestGangliaSources(unittest.TestCase):
+    def test_parse_source_list(self):
+        self.assertEqual(ganglia_sources.parse_source_list(['gmetad-dc1:8651', ' gmetad-dc2', '10.0.0.1:8649'], 8651),
+                         [('gmetad-dc1', 8651), ('gmetad-dc2', 8651), ('10.0.0.1', 8649)])
+
+    def test_concurrent(self):
+        def fetch_source(host, port):
+            time.sleep(0.3)
+            return [host]
+        start = time.time()
+        status = ganglia_sources.poll([('a', 1), ('b', 2), ('c', 3)], fetch_source)
+        self.assertTrue(time.time() - start < 0.6)
+        self.assertEqual([s.documents for s in status], [['a'], ['b'], ['c']])
+        self.assertTrue(status[0].elapsed >= 0.3)
+
+    def test_failure_isolation(self):
+        gmetad = fake_gmetad.FakeGmetad(lambda path: '<GANGLIA_XML></GANGLIA_XML>')
+        gmetad.start()
+        # a port nothing listens on
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        unused_port = unused.getsockname()[1]
+        unused.close()
+        def fetch_source(host, port):
+            sock = socket.create_connection((host, port), 5)
+            return [xml_spool.XMLSpool(1024).drain(sock)]
+        try:
+            status = ganglia_sources.poll([('127.0.0.1', unused_port), ('127.0.0.1', gmetad.port)], fetch_source)
+        finally:
+            gmetad.stop()
+        self.assertTrue(isinstance(status[0].error, socket.error))
+        self.assertEqual(status[0].documents, [])
+        self.assertEqual(status[1].error, None)
+        self.assertEqual(status[1].documents[0].read(), '<GANGLIA_XML></GANGLIA_XML>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import xml.sax
+import conf_parser
+import fake_gmetad
+from fake_io import RecordingWriter
+import gmetad_query
+import match_index
+import nagios_inventory
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+CLUSTER_XML = """<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>
+<GANGLIA_XML VERSION="3.6.0" SOURCE="gmetad">
+<GRID NAME="grid" AUTHORITY="http://localhost/ganglia/" LOCALTIME="1400000000">
+<CLUSTER NAME="%s" LOCALTIME="1400000000" OWNER="" LATLONG="" URL="">
+%s</CLUSTER>
+</GRID>
+</GANGLIA_XML>
+"""
+
+HOST_XML = """<HOST NAME="%s" IP="10.0.0.1" REPORTED="1399999990" TN="10" TMAX="20" DMAX="0" LOCATION="" GMOND_STARTED="0">
+<METRIC NAME="proc_total" VAL="%d" TYPE="uint32" UNITS="" TN="10" TMAX="950" DMAX="0" SLOPE="zero" SOURCE="gmond"/>
+</HOST>
+"""
+
+class TestQueryPaths(unittest.TestCase):
+    def test_paths(self):
+        clusters = [('web', {'www1': [], 'www2': []}), ('db', {r'db\d+': []})]
+        self.assertEqual(gmetad_query.query_paths(clusters, False, 20), ['/web/www1', '/web/www2', '/db'])
+        # too many hosts, or host names without the domain
+        self.assertEqual(gmetad_query.query_paths(clusters, False, 1), ['/web', '/db'])
+        self.assertEqual(gmetad_query.query_paths(clusters, True, 20), ['/web', '/db'])
+
+    def test_cluster_listed_twice(self):
+        # e.g. hosts and an aggregate of the same cluster
+        clusters = [('web', {'www1': []}), ('db', {'db1': []}), ('web', {'.*': []})]
+        self.assertEqual(gmetad_query.query_paths(clusters, False, 20), ['/web', '/db/db1'])
+
+    def test_full_dump_for_cluster_patterns(self):
+        clusters = [('web', {'www1': []}), ('.*', {'db1': []})]
+        self.assertEqual(gmetad_query.query_paths(clusters, False, 20), None)
+
+class TestFetch(unittest.TestCase):
+    def setUp (self):
+        def respond(path):
+            cluster_name = path.split('/')[1]
+            hosts = ['%s%d' % (cluster_name, i) for i in range(3)]
+            if path.count('/') == 2:
+                hosts = [path.split('/')[2]]
+            return CLUSTER_XML % (cluster_name, ''.join([HOST_XML % (h, 100) for h in hosts]))
+        self.gmetad = fake_gmetad.FakeGmetad(respond, interactive=True)
+        self.gmetad.start()
+
+    def tearDown(self):
+        self.gmetad.stop()
+
+    def test_fetch_and_parse(self):
+        proc_total = conf_parser.ThresholdRule('Total processes')
+        clusters = [('web', {'web1': [[('proc_total', proc_total)]]}),
+                    ('db', {r'db\d': [[('proc_total', proc_total)]]})]
+        inventory = nagios_inventory.NagiosInventory()
+        for host_name in ['web0', 'web1', 'db0', 'db1', 'db2']:
+            inventory.add(host_name, ['Total processes'])
+        paths = gmetad_query.query_paths(clusters, False, 20)
+        sources = gmetad_query.fetch_all('127.0.0.1', self.gmetad.port, paths, 1024 * 1024, parallel=2)
+        self.assertEqual(sorted(self.gmetad.requests), ['/db', '/web/web1'])
+        writer = RecordingWriter()
+        handler = bridge.GangliaHandler(match_index.MatchIndex(clusters, inventory), bridge.PassiveGenerator(0, 60), writer, False)
+        for source in sources:
+            parser = xml.sax.make_parser()
+            parser.setContentHandler(handler)
+            parser.parse(source)
+        self.assertEqual(writer.services(), [('web1', 'Total processes'), ('db0', 'Total processes'),
+                                           ('db1', 'Total processes'), ('db2', 'Total processes')])
+
+if __name__ == '__main__':
+    unittest.main()
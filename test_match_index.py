@@ -0,0 +1,94 @@
+#! /usr/bin/python
+
+import unittest
+import conf_parser
+import match_index
+import nagios_inventory
+
+class TestMatchIndex(unittest.TestCase):
+    def setUp (self):
+        proc_total = conf_parser.ThresholdRule('Total Processes', crit_above='200', warn_above='180')
+        load = conf_parser.ThresholdRule(r'Load avg \1 minute', crit_above='10', warn_above='5')
+        disk_free = conf_parser.ThresholdRule('DISK FREE', crit_below='2', warn_below='5')
+        common = [('proc_total', proc_total), (r'load_(\w+)', load)]
+        # same layout as ConfigParser.clusters
+        clusters = [
+            ('cluster_name', {'host_01': [common], 'host_02': [common, [('disk_free', disk_free)]]}),
+            ('web.*', {r'www\d+': [[('disk_free', disk_free)]]}),
+        ]
+        inventory = nagios_inventory.NagiosInventory()
+        inventory.add('host_01', ['Total Processes', 'Load avg one minute'])
+        inventory.add('host_02', ['Total Processes', 'DISK FREE'])
+        inventory.add('www1', ['DISK FREE'])
+        self.index = match_index.MatchIndex(clusters, inventory)
+
+    def test_exact_names(self):
+        host_tables = self.index.cluster('cluster_name')
+        self.assertEqual(len(host_tables), 1)
+        host = self.index.host(host_tables, 'host_02')
+        self.assertEqual(host.metric('disk_free')[1], 'DISK FREE')
+        self.assertEqual(host.metric('proc_total')[1], 'Total Processes')
+        self.assertEqual(host.metric('cpu_idle'), None)
+
+    def test_unknown_cluster_and_host(self):
+        self.assertEqual(self.index.cluster('other'), ())
+        host_tables = self.index.cluster('cluster_name')
+        self.assertEqual(self.index.host(host_tables, 'host_03'), None)
+        # configured in cluster_name but not in this cluster
+        self.assertEqual(self.index.host(self.index.cluster('web01'), 'host_01'), None)
+
+    def test_not_known_to_nagios(self):
+        host = self.index.host(self.index.cluster('cluster_name'), 'host_02')
+        # load_one is configured, but Nagios has no such service on host_02
+        self.assertEqual(host.metric('load_one'), None)
+        self.assertEqual(host.metric('cpu_idle'), None)
+        self.assertEqual(host.unknown, 1)
+
+    def test_patterns_and_placeholders(self):
+        host = self.index.host(self.index.cluster('cluster_name'), 'host_01')
+        metric_def, service_name = host.metric('load_one')
+        self.assertEqual(service_name, 'Load avg one minute')
+        self.assertEqual(host.metric('load_five'), None)
+        host = self.index.host(self.index.cluster('web01'), 'www1')
+        self.assertEqual(host.metric('disk_free')[1], 'DISK FREE')
+        # patterns must match the whole name
+        self.assertEqual(self.index.host(self.index.cluster('web01'), 'www1x'), None)
+        self.assertEqual(self.index.cluster('aweb'), ())
+
+    def test_alternation(self):
+        table = match_index.NameTable()
+        table.add('web|db', 'frontend')
+        self.assertEqual(len(table.lookup('web')), 1)
+        self.assertEqual(len(table.lookup('db')), 1)
+        # every branch must match the whole name
+        self.assertEqual(table.lookup('web01'), ())
+        self.assertEqual(table.lookup('db01'), ())
+        # the name itself is found once
+        self.assertEqual(table.lookup('web|db'), (('frontend', None),))
+
+    def test_literal_names(self):
+        index = match_index.MatchIndex([('Web (EU)', {'www1': [[]]})], nagios_inventory.NagiosInventory())
+        self.assertEqual(len(index.cluster('Web (EU)')), 1)
+        self.assertEqual(index.cluster('Web'), ())
+
+    def test_shared_results(self):
+        table = match_index.NameTable(False)
+        table.add(r'www\d+', 'web')
+        table.add('www1', 'web')
+        self.assertEqual(table.lookup('www1'), (('web', None), ('web', None)))
+        self.assertTrue(table.lookup('www2') is table.lookup('www3'))
+        # the matches are kept for placeholders
+        table = match_index.NameTable()
+        table.add(r'www(\d+)', 'web')
+        self.assertEqual(table.lookup('www2')[0][1].group(1), '2')
+
+    def test_resolved_limit(self):
+        table = match_index.NameTable(False, 10)
+        table.add(r'www\d+', 'web')
+        for n in range(25):
+            self.assertEqual(table.lookup('www%d' % n), (('web', None),))
+            self.assertTrue(len(table.resolved) <= 10)
+        self.assertEqual(table.lookup('db1'), ())
+
+if __name__ == '__main__':
+    unittest.main()
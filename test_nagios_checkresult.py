@@ -1,6 +1,9 @@
 #! /usr/bin/python
 
 import unittest
+import os
+import shutil
+import tempfile
 import time
 import textwrap
 import nagios_checkresult
@@ -56,5 +59,28 @@ class TestNagiosCheckResult(unittest.TestCase):
 	#compare the expected checkresult file with generated checkresult file
 	self.assertMultiLineEqual(self.testfile, self.checkresult, msg=None)
 
+    def test_sharding(self):
+	tmp_dir = tempfile.mkdtemp()
+	try:
+	    ng = nagios_checkresult.GenerateNagiosCheckResult(buffer_size=100)
+	    ng.create(tmp_dir, 1400347643.73, max_records=2)
+	    for i in range(5):
+		ng.build_service('Sat May 17 22:57:23 2014', 'host%d' % i, 'Total processes', 0, 0, 1, 1, 0.1, str(1399732963.0), str(1399732963.0), 0, 1, 0, 288, "", "")
+	    # the first two files are handed over to Nagios while writing
+	    self.assertEqual(len(ng.cmd_files), 3)
+	    self.assertTrue(os.path.exists(ng.cmd_files[1] + ".ok"))
+	    self.assertFalse(os.path.exists(ng.cmd_files[2] + ".ok"))
+	    self.assertEqual(ng.submit(), ng.cmd_files[2])
+	    counts = []
+	    for fname in ng.cmd_files:
+		content = open(fname).read()
+		self.assertTrue(content.startswith("### Active Check Result File ###\nfile_time=1400347643.73\n"))
+		self.assertTrue(os.path.exists(fname + ".ok"))
+		counts.append(content.count("### Nagios Service Check Result ###"))
+	    self.assertEqual(counts, [2, 2, 1])
+	    self.assertEqual(sorted(os.listdir(tmp_dir)), sorted([os.path.basename(f) + ext for f in ng.cmd_files for ext in ("", ".ok")]))
+	finally:
+	    shutil.rmtree(tmp_dir)
+
 if __name__ == '__main__':
     unittest.main()
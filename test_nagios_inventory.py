@@ -0,0 +1,60 @@
+#! /usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import nagios_inventory
+import poll_scheduler
+
+class TestNagiosInventory(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.nagios_cfg = os.path.join(self.tmp_dir, 'nagios.cfg')
+        open(self.nagios_cfg, 'w').write('cfg_file=objects.cfg\n')
+        self.cache_file = os.path.join(self.tmp_dir, 'inventory')
+        self.inventory = nagios_inventory.NagiosInventory()
+        self.inventory.add('xyz', ['Total processes', 'Current Load'])
+        self.inventory.add('abc', [])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_membership(self):
+        self.assertTrue(('xyz', 'Total processes') in self.inventory)
+        self.assertFalse(('xyz', 'DISK FREE') in self.inventory)
+        self.assertFalse(('nohost', 'Total processes') in self.inventory)
+        self.assertTrue(self.inventory.has_host('abc'))
+        self.assertEqual(self.inventory.services('nohost'), None)
+
+    def test_cache_roundtrip(self):
+        cache = nagios_inventory.InventoryCache(self.cache_file)
+        fingerprint = poll_scheduler.fingerprint([self.nagios_cfg])
+        self.assertEqual(cache.load(fingerprint), None)
+        cache.save(self.inventory, fingerprint)
+        loaded = cache.load(fingerprint)
+        self.assertEqual(loaded.hosts, self.inventory.hosts)
+
+    def test_shared_services(self):
+        self.inventory.add('pqr', ['Current Load', 'Total processes'])
+        self.assertTrue(self.inventory.services('pqr') is self.inventory.services('xyz'))
+        self.assertEqual(len(self.inventory.service_sets), 2)
+        cache = nagios_inventory.InventoryCache(self.cache_file)
+        fingerprint = poll_scheduler.fingerprint([self.nagios_cfg])
+        cache.save(self.inventory, fingerprint)
+        loaded = cache.load(fingerprint)
+        self.assertTrue(loaded.services('pqr') is loaded.services('xyz'))
+
+    def test_cache_invalidated_by_config_change(self):
+        cache = nagios_inventory.InventoryCache(self.cache_file)
+        cache.save(self.inventory, poll_scheduler.fingerprint([self.nagios_cfg]))
+        open(self.nagios_cfg, 'a').write('cfg_dir=conf.d\n')
+        self.assertEqual(cache.load(poll_scheduler.fingerprint([self.nagios_cfg])), None)
+
+    def test_corrupt_cache(self):
+        open(self.cache_file, 'w').write('not a cache')
+        cache = nagios_inventory.InventoryCache(self.cache_file)
+        self.assertEqual(cache.load(poll_scheduler.fingerprint([self.nagios_cfg])), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import os
+import random
+import shutil
+import tempfile
+import conf_parser
+import nagios_inventory
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+class TestPassiveGenerator(unittest.TestCase):
+    def setUp (self):
+        self.pg = bridge.PassiveGenerator(0, 60)
+        self.above = conf_parser.ThresholdRule('Total processes', crit_above='200', warn_above='180')
+        self.below = conf_parser.ThresholdRule('DISK FREE', crit_below='2', warn_below='5')
+
+    def test_thresholds(self):
+        self.assertEqual(self.pg.process(self.above, 100, 10, 60, 0), 0)
+        self.assertEqual(self.pg.process(self.above, 190, 10, 60, 0), 1)
+        self.assertEqual(self.pg.process(self.above, 201.5, 10, 60, 0), 2)
+        self.assertEqual(self.pg.process(self.below, 4.5, 10, 60, 0), 1)
+        self.assertEqual(self.pg.process(self.below, 1, 10, 60, 0), 2)
+        # SAX returns string values as unicode
+        self.assertEqual(self.pg.process(self.above, u'3.0.7', 10, 60, 0), 0)
+
+    def test_stale(self):
+        # older than TMAX + tmax_grace, or DMAX
+        self.assertEqual(self.pg.process(self.above, 100, 121, 60, 0), 3)
+        self.assertEqual(self.pg.process(self.above, 100, 31, 60, 30), 3)
+        pg = bridge.PassiveGenerator(20, 60)
+        self.assertEqual(pg.process(self.above, 100, 21, 60, 0), 3)
+
+    def test_batch_matches_process(self):
+        random.seed(1)
+        rules = [self.above, self.below, conf_parser.ThresholdRule('Uptime'),
+                 conf_parser.ThresholdRule('Load', crit_above='10', warn_above='5', warn_below='0.5')]
+        metrics = []
+        for i in range(500):
+            if i % 7 == 0:
+                value = u'version %d' % i
+            elif i % 3 == 0:
+                value = random.randint(0, 250)
+            else:
+                value = random.uniform(0, 250)
+            metrics.append((random.choice(rules), value, random.randint(0, 150), 60, random.choice([0, 0, 100])))
+        expected = [self.pg.process(*m) for m in metrics]
+        self.assertEqual(self.pg.process_batch(metrics), expected)
+        self.assertEqual(self.pg.process_batch(metrics[:5]), expected[:5])
+        if bridge.numpy is not None:
+            self.assertEqual(self.pg.process_numpy(metrics), expected)
+            forced = bridge.PassiveGenerator(50, 60)
+            self.assertEqual(forced.process_numpy(metrics), [forced.process(*m) for m in metrics])
+
+    def test_from_config(self):
+        # the Nagios inventory is not read again, pynag is not needed
+        class StubHosts:
+            inventory = nagios_inventory.NagiosInventory()
+            def changed(self):
+                return False
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_file = os.path.join(tmp_dir, 'bridge.conf')
+            text = open('ganglia-nagios-bridge.conf').read()
+            open(config_file, 'w').write(text.replace('force_dmax = 0', 'force_dmax = 300'))
+            b = bridge.Bridge(config_file)
+            b.nagios_hosts = StubHosts()
+            b.load()
+            self.assertEqual((b.value_handler.force_dmax, b.value_handler.tmax_grace), (300, 30))
+            # rebuilt when the configuration changes
+            open(config_file, 'w').write(text.replace('tmax_grace = 30', 'tmax_grace = 5'))
+            b.load()
+            self.assertEqual((b.value_handler.force_dmax, b.value_handler.tmax_grace), (0, 5))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#! /usr/bin/python
+
+import unittest
+import os
+import tempfile
+import poll_scheduler
+
+# clock that only advances when the scheduler sleeps or a cycle runs
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class TestPollScheduler(unittest.TestCase):
+    def setUp (self):
+        self.clock = FakeClock()
+        self.scheduler = poll_scheduler.PollScheduler(60, self.clock.time, self.clock.sleep)
+        self.starts = []
+
+    def run_cycles(self, durations):
+        durations = list(durations)
+        def cycle():
+            self.starts.append(self.clock.now)
+            self.clock.now += durations.pop(0)
+            if not durations:
+                self.scheduler.stop()
+        self.scheduler.run(cycle)
+
+    def test_no_drift(self):
+        self.run_cycles([5, 17.5, 59, 0.1])
+        self.assertEqual(self.starts, [1000.0, 1060.0, 1120.0, 1180.0])
+        self.assertEqual(self.scheduler.overruns, 0)
+
+    def test_overrun_skips_missed_runs(self):
+        self.run_cycles([130, 1, 1])
+        self.assertEqual(self.starts, [1000.0, 1180.0, 1240.0])
+        self.assertEqual(self.scheduler.overruns, 1)
+
+class TestFileWatcher(unittest.TestCase):
+    def test_changed(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            watcher = poll_scheduler.FileWatcher([path])
+            self.assertFalse(watcher.changed())
+            open(path, 'a').write('poll_interval = 30\n')
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+            os.unlink(path)
+            self.assertTrue(watcher.changed())
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+if __name__ == '__main__':
+    unittest.main()
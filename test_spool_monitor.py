@@ -0,0 +1,151 @@
+#! /usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import nagios_checkresult
+import spool_monitor
+
+# a Nagios that reads at most files_per_poll checkresult files per poll,
+# oldest first, as process_check_result_queue does
+class SlowReaper:
+    def __init__(self, result_dir, files_per_poll):
+        self.result_dir = result_dir
+        self.files_per_poll = files_per_poll
+        self.results = []
+
+    def reap(self):
+        pending = sorted(spool_monitor.SpoolMonitor(self.result_dir).pending(), key=lambda f: os.stat(f).st_mtime)
+        for cmd_file in pending[:self.files_per_poll]:
+            with open(cmd_file) as f:
+                self.results.extend(spool_monitor.split_records(f.read()))
+            nagios_checkresult.remove_files([cmd_file])
+
+    # the output of the last result read for every host and service
+    def latest(self):
+        latest = {}
+        for record in self.results:
+            latest[spool_monitor.record_key(record)] = record.split('output=')[1]
+        return latest
+
+class TestSpoolMonitor(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.result_dir = os.path.join(self.tmp_dir, 'checkresults')
+        os.mkdir(self.result_dir)
+        self.ledger_file = os.path.join(self.tmp_dir, 'ledger')
+        self.monitor = spool_monitor.SpoolMonitor(self.result_dir, self.ledger_file, 1, 0, 4)
+        self.mtime = time.time() - 1000
+
+    def tearDown (self):
+        shutil.rmtree(self.tmp_dir)
+
+    # writes the results of one poll the way Bridge.process() does
+    def poll(self, n, hosts=5):
+        pressure = self.monitor.measure()
+        gn = nagios_checkresult.GenerateNagiosCheckResult()
+        gn.create(self.result_dir, n, 0, defer_ok=pressure)
+        for h in range(hosts):
+            gn.build_host('', 'host%d' % h, 0, 0, 1, 1, 0.1, n, n, 0, 1, 0, 'poll %d' % n)
+            gn.build_service('', 'host%d' % h, 'load', 0, 0, 1, 1, 0.1, n, n, 0, 1, 0, None, None, 'poll %d' % n)
+        if pressure:
+            gn.close_file()
+            cmd_files, coalesced = self.monitor.coalesce(gn.cmd_files, n)
+        else:
+            gn.submit()
+            cmd_files, coalesced = gn.cmd_files, 0
+            self.monitor.record(cmd_files)
+        # the files are written within a second, order them for the reaper
+        for cmd_file in cmd_files:
+            self.mtime += 1
+            os.utime(cmd_file, (self.mtime, self.mtime))
+        return coalesced
+
+    def test_measure(self):
+        foreign = nagios_checkresult.GenerateNagiosCheckResult()
+        foreign.create(self.result_dir, 0)
+        foreign.submit()
+        os.utime(foreign.cmd_file, (time.time() - 300, time.time() - 300))
+        # still being written, not waiting for Nagios
+        open(os.path.join(self.result_dir, 'cabcdef'), 'w').close()
+        monitor = spool_monitor.SpoolMonitor(self.result_dir, max_age=600)
+        self.assertFalse(monitor.measure())
+        self.assertEqual(monitor.backlog, 1)
+        self.assertTrue(299 < monitor.backlog_age < 310)
+        monitor.max_age = 120
+        self.assertTrue(monitor.measure())
+        self.assertEqual(monitor.backoff, 1)
+        self.assertEqual(spool_monitor.SpoolMonitor(self.result_dir).owned(), [])
+
+    def test_slow_reaper(self):
+        foreign = nagios_checkresult.GenerateNagiosCheckResult()
+        foreign.create(self.result_dir, 0)
+        foreign.build_service('', 'host0', 'other', 0, 0, 1, 1, 0.1, 0, 0, 0, 1, 0, None, None, 'foreign')
+        foreign.submit()
+        os.utime(foreign.cmd_file, (self.mtime, self.mtime))
+        reaper = SlowReaper(self.result_dir, 0)
+        coalesced = [self.poll(n) for n in range(1, 7)]
+        # from the second poll, the unread file is merged with the new one
+        self.assertEqual(coalesced, [0, 10, 10, 10, 10, 10])
+        self.assertEqual(len(self.monitor.pending()), 2)
+        self.assertEqual(len(self.monitor.owned()), 1)
+        self.assertEqual(self.monitor.backoff, 4)
+        self.assertTrue(os.path.exists(foreign.cmd_file))
+        reaper.files_per_poll = 1
+        for n in range(7, 12):
+            reaper.reap()
+            self.poll(n)
+        reaper.files_per_poll = 10
+        reaper.reap()
+        latest = reaper.latest()
+        self.assertEqual(len(latest), 11)
+        self.assertEqual(latest[('host0', 'other')], ' foreign\\n\n')
+        self.assertEqual(latest[('host3', '')], ' poll 11\\n\n')
+        self.assertEqual(latest[('host3', 'load')], ' poll 11\\n\n')
+        # every poll reached Nagios or was replaced by a newer one: the
+        # merged file still stands for six unread files at poll 7, so
+        # it is merged once more
+        self.assertEqual(len(reaper.results), 1 + 10 + 10 * 4)
+        self.assertEqual(self.monitor.pending(), [])
+        self.assertFalse(self.monitor.measure())
+        self.assertEqual(self.monitor.backoff, 1)
+        self.monitor.record([])
+        self.assertEqual(open(self.ledger_file).read(), '')
+
+    # Nagios reads nothing and the bridge is the only producer, the
+    # merged file must not be mistaken for Nagios catching up
+    def stalled(self, monitor, polls):
+        start = time.time() - 1000
+        backoff = []
+        for n in range(polls):
+            now = start + 60 * n
+            pressure = monitor.measure(now)
+            backoff.append(monitor.backoff)
+            gn = nagios_checkresult.GenerateNagiosCheckResult()
+            gn.create(self.result_dir, int(now), 0, defer_ok=pressure)
+            gn.build_host('', 'host0', 0, 0, 1, 1, 0.1, n, n, 0, 1, 0, 'poll %d' % n)
+            if pressure:
+                gn.close_file()
+                monitor.coalesce(gn.cmd_files, int(now))
+            else:
+                gn.submit()
+                monitor.record(gn.cmd_files, now)
+        return backoff
+
+    def test_stalled_reaper(self):
+        monitor = spool_monitor.SpoolMonitor(self.result_dir, self.ledger_file, 3, 0, 4)
+        self.assertEqual(self.stalled(monitor, 8), [1, 1, 1, 1, 2, 4, 4, 4])
+        self.assertEqual(len(monitor.pending()), 1)
+        self.assertEqual(monitor.backlog, 7)
+        SlowReaper(self.result_dir, 10).reap()
+        self.assertFalse(monitor.measure())
+        self.assertEqual(monitor.backoff, 1)
+        os.unlink(self.ledger_file)
+        monitor = spool_monitor.SpoolMonitor(self.result_dir, self.ledger_file, 0, 30, 4)
+        self.assertEqual(self.stalled(monitor, 6), [1, 2, 4, 4, 4, 4])
+        self.assertTrue(monitor.backlog_age >= 240)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#! /usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import state_store
+
+class TestLastStateStore(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_suppress_unchanged(self):
+        store = state_store.LastStateStore(self.path, 600)
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 0, 1000))
+        self.assertFalse(store.should_emit('xyz', 'Total processes', 0, 1060))
+        # state change
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 2, 1120))
+        self.assertFalse(store.should_emit('xyz', 'Total processes', 2, 1180))
+        # host checks are kept separately from services
+        self.assertTrue(store.should_emit('xyz', '', 2, 1180))
+        # forced refresh
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 2, 1720))
+        self.assertFalse(store.should_emit('xyz', 'Total processes', 2, 1780))
+        store.close()
+
+    def test_persistent_and_growing(self):
+        store = state_store.LastStateStore(self.path, 600)
+        for i in range(5000):
+            self.assertTrue(store.should_emit('host%d' % i, 'Current Load', i % 4, 1000))
+        store.commit()
+        self.assertTrue(store.slots > state_store.INITIAL_SLOTS)
+        store.close()
+        store = state_store.LastStateStore(self.path, 600)
+        self.assertEqual(store.used, 5000)
+        for i in range(5000):
+            self.assertFalse(store.should_emit('host%d' % i, 'Current Load', i % 4, 1060))
+        self.assertTrue(store.should_emit('host1', 'Current Load', 0, 1060))
+        store.close()
+
+    def test_uncommitted(self):
+        store = state_store.LastStateStore(self.path, 600)
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 0, 1000))
+        store.commit()
+        # the poll failed before the results reached Nagios
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 2, 1060))
+        store.close()
+        # the state change is not suppressed in the next poll
+        store = state_store.LastStateStore(self.path, 600)
+        self.assertFalse(store.should_emit('xyz', 'Total processes', 0, 1120))
+        self.assertTrue(store.should_emit('xyz', 'Total processes', 2, 1120))
+        store.close()
+
+    def test_not_a_state_file(self):
+        open(self.path, 'w').write('### Active Check Result File ###\n')
+        self.assertRaises(ValueError, state_store.LastStateStore, self.path, 600)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import xml.sax
+from cStringIO import StringIO
+import benchmark
+import conf_parser
+from fake_io import RecordingWriter, ChunkedReader
+import match_index
+import subtree_filter
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+class TestSubtreeFilter(unittest.TestCase):
+    def setUp (self):
+        self.xml_data = benchmark.generate_grid(4, 6, 8)
+        clusters = benchmark.synthetic_config(2, 6, 3)
+        # only some of the hosts of the second cluster
+        for host_name in clusters[1][1].keys():
+            if host_name.endswith('1') or host_name.endswith('4'):
+                del clusters[1][1][host_name]
+        # a host pattern and a cluster pattern
+        clusters.append(('cluster00[3]', {r'c003-h\d+1': clusters[0][1].values()[0]}))
+        inventory = benchmark.synthetic_inventory(4, 5, 3)
+        self.index = match_index.MatchIndex(clusters, inventory)
+
+    def parse(self, source):
+        writer = RecordingWriter()
+        handler = bridge.GangliaHandler(self.index, bridge.PassiveGenerator(0, 60), writer, True)
+        parser = xml.sax.make_parser()
+        parser.setContentHandler(handler)
+        parser.parse(source)
+        return writer.calls, handler.elements
+
+    def test_same_results(self):
+        expected, all_elements = self.parse(StringIO(self.xml_data))
+        self.assertTrue(len(expected) > 0)
+        for chunk_size in [1, 7, 100, 4096, len(self.xml_data)]:
+            document = subtree_filter.SubtreeFilter(ChunkedReader(self.xml_data, chunk_size), self.index, True)
+            results, elements = self.parse(document)
+            self.assertEqual(results, expected)
+            self.assertTrue(elements < all_elements)
+            # cluster002, the host outside the inventory in cluster000,
+            # 3 hosts of cluster001 and 5 outside the pattern in cluster003
+            self.assertEqual(document.skipped, 1 + 1 + 3 + 5)
+
+    def test_attribute_values(self):
+        xml_data = ('<GANGLIA_XML><CLUSTER NAME="a&amp;b" LOCALTIME="1"><HOST NAME="h1" TAGS="x>y"/>'
+                    '<HOST NAME="h2" REPORTED="1" TN="1" TMAX="20"><METRIC NAME="m" VAL="1" TYPE="int32" UNITS="" TN="1" TMAX="60" DMAX="0"/></HOST>'
+                    '</CLUSTER><CLUSTER NAME="other" LOCALTIME="1"><HOST NAME="h2"></HOST></CLUSTER></GANGLIA_XML>')
+        clusters = [('a&b', {'h2': [[('m', conf_parser.ThresholdRule('M'))]]})]
+        inventory = benchmark.nagios_inventory.NagiosInventory()
+        inventory.add('h2', ['M'])
+        index = match_index.MatchIndex(clusters, inventory)
+        for chunk_size in [1, 3, 1000]:
+            document = subtree_filter.SubtreeFilter(ChunkedReader(xml_data, chunk_size), index, False)
+            self.assertEqual(document.read(), '<GANGLIA_XML><CLUSTER NAME="a&amp;b" LOCALTIME="1">'
+                             + xml_data[xml_data.index('<HOST NAME="h2"'):xml_data.index('<CLUSTER NAME="other"')] + '</GANGLIA_XML>')
+            self.assertEqual(document.skipped, 2)
+
+if __name__ == '__main__':
+    unittest.main()
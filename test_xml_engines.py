@@ -0,0 +1,46 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+from cStringIO import StringIO
+import benchmark
+import conf_parser
+from fake_io import RecordingWriter, ChunkedReader
+import match_index
+import nagios_inventory
+import xml_engines
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+class TestXMLEngines(unittest.TestCase):
+    def setUp (self):
+        self.xml_data = benchmark.generate_grid(3, 5, 12)
+        clusters = benchmark.synthetic_config(2, 5, 8)
+        # patterns with placeholders, and a host Nagios does not know
+        clusters.append((r'cluster00\d', {r'c00(\d)-h0000[0-3]': [[(r'metric_(01\d)', conf_parser.ThresholdRule(r'Pattern \1', warn_above='50'))]]}))
+        inventory = benchmark.synthetic_inventory(3, 4, 8)
+        inventory.add('c002-h00001', ['Pattern 010', 'Pattern 011'])
+        self.index = match_index.MatchIndex(clusters, inventory)
+
+    def parse(self, engine, document):
+        writer = RecordingWriter()
+        handler = bridge.GangliaHandler(self.index, bridge.PassiveGenerator(0, 60), writer, True)
+        engine(document, handler)
+        return writer.calls, handler
+
+    def test_same_output(self):
+        expected, sax_handler = self.parse(xml_engines.parse_sax, StringIO(self.xml_data))
+        self.assertTrue(len(expected) > 50)
+        self.assertTrue(('service', 'c002-h00001', 'Pattern 011') in [call[:3] for call in expected])
+        for chunk_size in [1, 100, 65536]:
+            calls, handler = self.parse(xml_engines.parse_expat, ChunkedReader(self.xml_data, chunk_size))
+            self.assertEqual(calls, expected)
+            self.assertEqual(handler.elements, sax_handler.elements)
+            self.assertEqual(handler.metrics_unknown, sax_handler.metrics_unknown)
+
+    def test_invalid_xml(self):
+        for engine in xml_engines.ENGINES.values():
+            self.assertRaises(xml_engines.PARSE_ERRORS, self.parse, engine, StringIO(self.xml_data[:5000] + '<'))
+
+if __name__ == '__main__':
+    unittest.main()
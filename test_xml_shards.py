@@ -0,0 +1,95 @@
+#! /usr/bin/python
+
+import unittest
+import imp
+import os
+import re
+import shutil
+import tempfile
+import xml.sax
+from cStringIO import StringIO
+import benchmark
+import bridge_stats
+import conf_parser
+import match_index
+import nagios_checkresult
+import xml_shards
+
+bridge = imp.load_source('ganglia_nagios_bridge', 'ganglia-nagios-bridge.py')
+
+# fails on the first metric of the first host of cluster002
+class FailingGenerator(bridge.PassiveGenerator):
+    def process_batch(self, metrics):
+        for metric in metrics:
+            if metric[1] == 0.14:
+                raise ValueError('failed')
+        return bridge.PassiveGenerator.process_batch(self, metrics)
+
+# returns the check results in the checkresult files as a sorted list,
+# without the informational time
+def read_results(cmd_files):
+    results = []
+    for cmd_file in cmd_files:
+        for record in open(cmd_file).read().split('\n\n')[1:]:
+            results.append(re.sub(r'# Time: .*\n', '', record.strip()))
+    return sorted(results)
+
+class TestXMLShards(unittest.TestCase):
+    def setUp (self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.xml_data = benchmark.generate_grid(4, 3, 4)
+        self.config = conf_parser.ConfigParser()
+        self.config.parse('ganglia-nagios-bridge.conf')
+        self.config.nagios_result_dir = self.tmp_dir
+        self.config.parse_processes = 2
+        self.config.strip_domains = True
+        self.index = match_index.MatchIndex(benchmark.synthetic_config(3, 3, 2), benchmark.synthetic_inventory(4, 3, 2))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def bridge(self, value_handler):
+        b = bridge.Bridge('ganglia-nagios-bridge.conf', value_handler)
+        b.config = self.config
+        b.index = self.index
+        return b
+
+    def test_split(self):
+        prefix_end, suffix_start, ranges = xml_shards.split_clusters(self.xml_data, 2)
+        self.assertEqual(len(ranges), 2)
+        self.assertTrue(self.xml_data[prefix_end:].startswith('<CLUSTER NAME="cluster000"'))
+        self.assertEqual(self.xml_data[suffix_start:], '\n</GRID>\n</GANGLIA_XML>\n')
+        self.assertEqual(''.join([self.xml_data[start:end] for start, end in ranges]),
+                         self.xml_data[prefix_end:suffix_start])
+        self.assertEqual(len(xml_shards.split_clusters(self.xml_data, 100)[2]), 4)
+        # nested grids and documents without clusters are not split
+        nested = self.xml_data.replace('</CLUSTER>\n<CLUSTER NAME="cluster002"', '</CLUSTER>\n</GRID><GRID NAME="b">\n<CLUSTER NAME="cluster002"')
+        self.assertEqual(xml_shards.split_clusters(nested, 2), None)
+        self.assertEqual(xml_shards.split_clusters('<GANGLIA_XML/>', 2), None)
+
+    def test_same_results(self):
+        gn = nagios_checkresult.GenerateNagiosCheckResult()
+        gn.create(self.tmp_dir, 1400000000)
+        parser = xml.sax.make_parser()
+        parser.setContentHandler(bridge.GangliaHandler(self.index, bridge.PassiveGenerator(0, 60), gn, True))
+        parser.parse(StringIO(self.xml_data))
+        gn.submit()
+        expected = read_results(gn.cmd_files)
+
+        stats = bridge_stats.BridgeStats()
+        files = self.bridge(bridge.PassiveGenerator(0, 60)).parse_sharded(self.xml_data, stats, 1400000000, 'test')
+        self.assertEqual(len(files), 4)
+        # the ok-to-go indicators are left to the caller
+        for cmd_file in files:
+            self.assertFalse(os.path.exists(cmd_file + '.ok'))
+        self.assertEqual(read_results(files), expected)
+        self.assertEqual(stats.counters['results_written'], len(expected))
+        self.assertEqual(stats.counters['subtrees_skipped'], 1)
+
+    def test_failed_shard(self):
+        stats = bridge_stats.BridgeStats()
+        self.assertRaises(RuntimeError, self.bridge(FailingGenerator(0, 60)).parse_sharded, self.xml_data, stats, 1400000000, 'test')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
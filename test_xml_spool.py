@@ -0,0 +1,37 @@
+#! /usr/bin/python
+
+import unittest
+import socket
+import threading
+import xml_spool
+
+class TestXMLSpool(unittest.TestCase):
+    def drain(self, data, max_memory):
+        server, client = socket.socketpair()
+        def send():
+            server.sendall(data)
+            server.close()
+        sender = threading.Thread(target=send)
+        sender.start()
+        spool = xml_spool.XMLSpool(max_memory)
+        f = spool.drain(client)
+        sender.join()
+        return spool, f, client
+
+    def test_in_memory(self):
+        data = '<GANGLIA_XML VERSION="3.6.0" SOURCE="gmetad"></GANGLIA_XML>\n'
+        spool, f, client = self.drain(data, 1024)
+        self.assertEqual(f.read(), data)
+        self.assertEqual(spool.bytes_received, len(data))
+        self.assertTrue(spool.connection_time >= 0)
+        # the connection is closed as soon as the XML has been read
+        self.assertRaises(socket.error, client.recv, 1)
+
+    def test_spill_to_disk(self):
+        data = '<GANGLIA_XML>' + '<HOST NAME="xyz"/>' * 10000 + '</GANGLIA_XML>'
+        spool, f, client = self.drain(data, 1024)
+        self.assertEqual(f.read(), data)
+        self.assertEqual(spool.bytes_received, len(data))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+#
+# xml_engines - the XML parsers that can drive GangliaHandler
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import xml.sax
+from xml.parsers import expat
+
+READ_SIZE = 64 * 1024
+
+# errors raised by the engines for invalid XML
+PARSE_ERRORS = (xml.sax.SAXException, expat.ExpatError)
+
+# element and attribute names shared by every expat parser, so each name
+# is only allocated once for the life of the process
+_names = {}
+
+
+# the standard SAX parser, the handler receives AttributesImpl objects
+def parse_sax(document, handler):
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(handler)
+    parser.parse(document)
+
+
+# Drives the same handler methods from pyexpat directly.  The handler
+# receives the attributes as a plain dict and names and values as byte
+# strings instead of unicode, saving an AttributesImpl and the decoding
+# of every value.  Character data is buffered as the handler ignores it.
+def parse_expat(document, handler):
+    parser = expat.ParserCreate(None, None, _names)
+    parser.returns_unicode = False
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.startElement
+    parser.EndElementHandler = handler.endElement
+    try:
+        while True:
+            data = document.read(READ_SIZE)
+            if not data:
+                break
+            parser.Parse(data, False)
+        parser.Parse('', True)
+    finally:
+        document.close()
+    handler.endDocument()
+
+
+ENGINES = {'sax': parse_sax, 'expat': parse_expat}
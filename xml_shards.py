@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#
+# xml_shards - splits a buffered Ganglia XML document at CLUSTER
+# boundaries and parses the pieces in a pool of processes
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+from cStringIO import StringIO
+import multiprocessing
+
+CLUSTER_START = '<CLUSTER '
+CLUSTER_END = '</CLUSTER>'
+# shards per process, smaller shards even out clusters of different sizes
+SHARDS_PER_PROCESS = 4
+
+# the document being parsed and the function parsing each shard.  The
+# pool processes are forked after it is set, so they inherit it instead
+# of receiving a copy of the XML through a pipe.
+_shared = None
+
+
+# Returns (prefix_end, suffix_start, ranges) where data[:prefix_end]
+# opens the document up to the first CLUSTER, data[suffix_start:] closes
+# it after the last one and each (start, end) in ranges covers a run of
+# consecutive CLUSTER elements, at most count of them.  Returns None if
+# the document has no CLUSTER or something other than white space
+# separates two clusters, as in nested GRIDs.
+def split_clusters(data, count):
+    prefix_end = data.find(CLUSTER_START)
+    if prefix_end < 0:
+        return None
+    clusters = []
+    pos = prefix_end
+    while True:
+        start = data.find(CLUSTER_START, pos)
+        if start < 0:
+            break
+        if data[pos:start].strip():
+            return None
+        end = data.find(CLUSTER_END, start)
+        if end < 0:
+            return None
+        pos = end + len(CLUSTER_END)
+        clusters.append((start, pos))
+    suffix_start = pos
+    target = (suffix_start - prefix_end) / count + 1
+    ranges = []
+    shard_start = prefix_end
+    for start, end in clusters:
+        if end - shard_start >= target:
+            ranges.append((shard_start, end))
+            shard_start = end
+    if shard_start < suffix_start:
+        ranges.append((shard_start, suffix_start))
+    return prefix_end, suffix_start, ranges
+
+
+# returns shard i of the shared document as a complete XML document
+def shard_document(i):
+    data, (prefix_end, suffix_start, ranges), parse_shard = _shared
+    start, end = ranges[i]
+    return StringIO(data[:prefix_end] + data[start:end] + data[suffix_start:])
+
+
+def run_shard(i):
+    return _shared[2](shard_document(i))
+
+
+# Calls parse_shard(document) for every shard of data in a pool of
+# processes and returns the results in document order, or None if data
+# cannot be split.  parse_shard runs in the forked processes, so it may
+# be a closure; its result must be picklable.
+def map_shards(data, parse_shard, processes):
+    global _shared
+    split = split_clusters(data, processes * SHARDS_PER_PROCESS)
+    if split is None:
+        return None
+    _shared = (data, split, parse_shard)
+    try:
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(run_shard, range(len(split[2])), 1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _shared = None
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# xml_spool - reads the complete Ganglia XML from gmetad before it is
+# parsed, so the gmetad connection is not held open while parsing
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###########################################################################
+
+import errno
+import socket
+import tempfile
+import time
+
+# size of each recv() call while draining the socket
+READ_SIZE = 1024 * 1024
+
+
+# sock.recv() carrying on when a signal handler interrupts it.  Python 2
+# raises EINTR from a socket with a timeout even if the signal restarts
+# system calls, as the select() waiting for the data is never restarted.
+def recv(sock, size):
+    while True:
+        try:
+            return sock.recv(size)
+        except socket.error as e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+# Buffers the XML in memory, spilling to a temporary file on disk once
+# it grows beyond max_memory bytes
+class XMLSpool:
+    def __init__(self, max_memory, spool_dir=None):
+        self.max_memory = max_memory
+        self.spool_dir = spool_dir
+        self.bytes_received = 0
+        self.connection_time = 0.0
+
+    # reads everything from sock, closes it and returns a file object
+    # positioned at the start of the XML
+    def drain(self, sock):
+        spool = tempfile.SpooledTemporaryFile(max_size=self.max_memory, prefix='ganglia-xml', dir=self.spool_dir)
+        start = time.time()
+        try:
+            while True:
+                data = recv(sock, READ_SIZE)
+                if not data:
+                    break
+                spool.write(data)
+                self.bytes_received += len(data)
+        finally:
+            sock.close()
+            self.connection_time = time.time() - start
+        spool.seek(0)
+        return spool
+